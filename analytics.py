@@ -0,0 +1,105 @@
+import numpy as np
+
+FIELDS = ('num_cities', 'beige_turns', 'soldiers', 'tanks', 'aircraft', 'ships', 'missiles', 'nukes')
+
+# Units a single city can hold with every military improvement slot filled
+# (5 barracks, 5 factories, 5 hangars, 3 drydocks).
+MAX_UNITS_PER_CITY = {
+    'soldiers': 15000,
+    'tanks': 1250,
+    'aircraft': 75,
+    'ships': 15,
+}
+
+READINESS_WEIGHTS = {
+    'soldiers': 0.25,
+    'tanks': 0.25,
+    'aircraft': 0.35,
+    'ships': 0.15,
+}
+
+CITY_BANDS = [1, 10, 15, 20, 25, 30, 40]
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+
+def load_columns(rows):
+    # rows are tuples ordered like FIELDS followed by the nation color;
+    # missing numbers become 0 and missing colors 'unknown'.
+    rows = list(rows)
+    matrix = np.array([row[:len(FIELDS)] for row in rows], dtype=np.float64).reshape(-1, len(FIELDS))
+    matrix = np.nan_to_num(matrix)
+    columns = {field: matrix[:, i] for i, field in enumerate(FIELDS)}
+    columns['color'] = np.array([row[len(FIELDS)] or 'unknown' for row in rows], dtype=str)
+    return columns
+
+
+def militarization(columns):
+    cities = np.maximum(columns['num_cities'], 1)
+    return {
+        unit: np.clip(columns[unit] / (cities * capacity), 0, 1)
+        for unit, capacity in MAX_UNITS_PER_CITY.items()
+    }
+
+
+def readiness_scores(ratios):
+    return sum(ratios[unit] * weight for unit, weight in READINESS_WEIGHTS.items()) * 100
+
+
+def _band_label(low, high):
+    return f'{low}+' if high is None else f'{low}-{high - 1}'
+
+
+def _percentiles(values):
+    if not values.size:
+        return None
+    return dict(zip((f'p{p}' for p in PERCENTILES), np.round(np.percentile(values, PERCENTILES), 2).tolist()))
+
+
+def summarize(columns):
+    count = columns['num_cities'].size
+    if not count:
+        return {'nations': 0}
+
+    ratios = militarization(columns)
+    readiness = readiness_scores(ratios)
+
+    # Nations with no city count on record go in the lowest band rather
+    # than dropping out of the breakdown.
+    band_index = np.maximum(np.digitize(columns['num_cities'], CITY_BANDS), 1)
+    bands = []
+    for i, low in enumerate(CITY_BANDS):
+        high = CITY_BANDS[i + 1] if i + 1 < len(CITY_BANDS) else None
+        mask = band_index == i + 1
+        if not mask.any():
+            continue
+        bands.append({
+            'cities': _band_label(low, high),
+            'nations': int(mask.sum()),
+            'readiness': _percentiles(readiness[mask]),
+            'militarization': {unit: round(float(ratio[mask].mean()) * 100, 2) for unit, ratio in ratios.items()}
+        })
+
+    colors, color_counts = np.unique(columns['color'], return_counts=True)
+    beige = columns['beige_turns'] > 0
+
+    return {
+        'nations': int(count),
+        'cities': int(columns['num_cities'].sum()),
+        'readiness': {
+            'mean': round(float(readiness.mean()), 2),
+            **_percentiles(readiness)
+        },
+        'militarization': {unit: round(float(ratio.mean()) * 100, 2) for unit, ratio in ratios.items()},
+        'totals': {
+            unit: int(columns[unit].sum())
+            for unit in ('soldiers', 'tanks', 'aircraft', 'ships', 'missiles', 'nukes')
+        },
+        'city_bands': bands,
+        'colors': dict(zip(colors.tolist(), color_counts.astype(int).tolist())),
+        'beige': {
+            'nations': int(beige.sum()),
+            'share': round(float(beige.mean()) * 100, 2),
+            'turns': _percentiles(columns['beige_turns'][beige])
+        }
+    }
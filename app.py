@@ -1,19 +1,30 @@
-from flask import Flask, render_template, redirect, url_for, session, request, jsonify, flash, send_file
-from flask_sqlalchemy import SQLAlchemy
+from flask import Flask, Blueprint, current_app, render_template, redirect, url_for, session, request, jsonify, flash, g, Response, abort
+from sqlalchemy.engine import make_url
 from functools import wraps
-import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 import pnwkit
 from config import Config
+from cache import create_cache, FragmentCache
+from pagination import RateLimiter, iter_pages, encode_cursor, decode_cursor
+from roster_query import NationQuery
+from exports import export_response, validate_format
+from dashboard import gather_sources
+import analytics
+import inactivity
+from transfers import TokenBucket, KitCache, backoff_delay, never_sent, graphql_error, parse_resources
+from instrumentation import InstrumentedKit, metrics
+from clients import create_clients
+from events import create_events
+from profiling import init_profiling
+from assets import init_assets
+from lazy import Lazy
+from models import db, User, Announcement, ActivityLog, Nation, PriceSnapshot, PriceRollup, BankTransfer, SlowRequest, War, InactivityChange, InactivityDaily
 import os
-import csv
-import io
+import json
+import uuid
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-
-from models import User, Announcement, ActivityLog
+bp = Blueprint('main', __name__)
 
 DISCORD_CLIENT_ID = os.getenv('DISCORD_CLIENT_ID')
 DISCORD_CLIENT_SECRET = os.getenv('DISCORD_CLIENT_SECRET')
@@ -21,17 +32,70 @@ DISCORD_REDIRECT_URI = os.getenv('DISCORD_REDIRECT_URI', 'http://localhost:5000/
 DISCORD_API_BASE = 'https://discord.com/api/v10'
 
 PNW_API_KEY = os.getenv('PNW_API_KEY')
-ALLIANCE_ID = int(os.getenv('ALLIANCE_ID', '0'))
+ALLIANCE_IDS = Config.ALLIANCE_IDS
 
-kit = pnwkit.QueryKit(PNW_API_KEY)
+# Clients are built from the app config the first time they are used, and
+# rebuilt in each forked worker.
+http_clients = Lazy(lambda: create_clients(current_app.config))
+kit = Lazy(lambda: InstrumentedKit(pnwkit.QueryKit(PNW_API_KEY, url=current_app.config['PNW_API_URL'],
+                                                   requests_session=http_clients['pnw'])))
+cache = Lazy(lambda: create_cache(current_app.config, logger=current_app.logger))
+fragments = Lazy(lambda: FragmentCache(cache, local_ttl=current_app.config['FRAGMENT_LOCAL_TTL']))
+events = Lazy(lambda: create_events(current_app.config, logger=current_app.logger))
+pnw_limiter = Lazy(lambda: RateLimiter(current_app.config['PNW_RATE_LIMIT']))
+dashboard_executor = Lazy(lambda: ThreadPoolExecutor(current_app.config['DASHBOARD_WORKERS'],
+                                                     thread_name_prefix='dashboard'))
+transfer_bucket = Lazy(lambda: TokenBucket(current_app.config['TRANSFER_RATE'], current_app.config['TRANSFER_BURST']))
+user_kits = Lazy(lambda: KitCache(lambda api_key, url=current_app.config['PNW_API_URL']: InstrumentedKit(
+    pnwkit.QueryKit(api_key, url=url, requests_session=http_clients['pnw_mutations']))))
 
 ADMIN_RANKS = ['Bushido', 'Daimyo', 'Shogun']
 
+RESOURCES = ['food', 'coal', 'oil', 'uranium', 'lead', 'iron', 'bauxite', 
+             'gasoline', 'munitions', 'steel', 'aluminum']
+
+TRANSFER_FIELDS = ['money'] + RESOURCES
+
+CHECK_BANK = 'Check the in-game bank before retrying.'
+
+NATION_COLORS = ['aqua', 'beige', 'black', 'blue', 'brown', 'gray', 'green', 'lime', 'maroon',
+                 'olive', 'orange', 'pink', 'purple', 'red', 'white', 'yellow']
+
+NATION_FIELDS = ['id', 'nation_name', 'num_cities', 'beige_turns', 'projects', 'soldiers', 'tanks',
+                 'aircraft', 'ships', 'missiles', 'nukes', 'color', 'last_active', 'alliance_position']
+
+@bp.app_context_processor
+def inject_admin_ranks():
+    return {'admin_ranks': ADMIN_RANKS}
+
+def get_current_user():
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, session['user_id']) if 'user_id' in session else None
+    return g.current_user
+
+def current_user_is_admin():
+    user = get_current_user()
+    return user is not None and user.rank in ADMIN_RANKS
+
+def current_role():
+    return 'admin' if current_user_is_admin() else 'member'
+
+def current_alliance_id():
+    # Members see their own alliance. Admins can look at any alliance in
+    # the coalition with ?alliance_id=.
+    user = get_current_user()
+    requested = request.args.get('alliance_id', type=int)
+    if requested in ALLIANCE_IDS and user.rank in ADMIN_RANKS:
+        return requested
+    if user.alliance_id in ALLIANCE_IDS:
+        return user.alliance_id
+    return ALLIANCE_IDS[0]
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -39,11 +103,14 @@ def nation_linked_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
+            return redirect(url_for('main.login'))
+        user = get_current_user()
         if not user or not user.nation_id:
             flash('Please link your P&W nation first.', 'warning')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
+        if user.alliance_id is not None and user.alliance_id not in ALLIANCE_IDS:
+            flash('Your nation is no longer in the coalition. Link a member nation to continue.', 'warning')
+            return redirect(url_for('main.profile'))
         return f(*args, **kwargs)
     return decorated_function
 
@@ -51,34 +118,34 @@ def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            return redirect(url_for('login'))
-        user = User.query.get(session['user_id'])
+            return redirect(url_for('main.login'))
+        user = get_current_user()
         if not user or not user.nation_id:
             flash('Please link your P&W nation first.', 'warning')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         if user.rank not in ADMIN_RANKS:
             flash('You do not have permission to access this page.', 'danger')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         return f(*args, **kwargs)
     return decorated_function
 
-@app.route('/')
+@bp.route('/')
 def index():
     if 'user_id' in session:
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     return render_template('login.html')
 
-@app.route('/login')
+@bp.route('/login')
 def login():
     discord_login_url = f"{DISCORD_API_BASE}/oauth2/authorize?client_id={DISCORD_CLIENT_ID}&redirect_uri={DISCORD_REDIRECT_URI}&response_type=code&scope=identify"
     return redirect(discord_login_url)
 
-@app.route('/callback')
+@bp.route('/callback')
 def callback():
     code = request.args.get('code')
     if not code:
         flash('Login failed. Please try again.', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     try:
         data = {
@@ -89,12 +156,13 @@ def callback():
             'redirect_uri': DISCORD_REDIRECT_URI
         }
         headers = {'Content-Type': 'application/x-www-form-urlencoded'}
-        r = requests.post(f"{DISCORD_API_BASE}/oauth2/token", data=data, headers=headers)
+        r = http_clients['discord'].post(f"{DISCORD_API_BASE}/oauth2/token", data=data, headers=headers)
         r.raise_for_status()
         token = r.json()
         
         headers = {'Authorization': f"Bearer {token['access_token']}"}
-        r = requests.get(f"{DISCORD_API_BASE}/users/@me", headers=headers)
+        r = http_clients['discord'].get(f"{DISCORD_API_BASE}/users/@me", headers=headers)
+        r.raise_for_status()
         discord_user = r.json()
         
         user = User.query.filter_by(discord_id=discord_user['id']).first()
@@ -107,33 +175,30 @@ def callback():
             db.session.add(user)
             db.session.commit()
             flash('Welcome! Please link your P&W nation to continue.', 'info')
-        else:
-            if user.nation_id:
-                sync_user_rank(user)
         
         session['user_id'] = user.id
         session['discord_username'] = user.discord_username
         
         if not user.nation_id:
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
         
     except Exception as e:
-        app.logger.error(f"Login error: {e}")
+        current_app.logger.error(f"Login error: {e}")
         flash('Login failed. Please try again.', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
-@app.route('/profile', methods=['GET', 'POST'])
+@bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     
     if request.method == 'POST':
         nation_name = request.form.get('nation_name', '').strip()
@@ -147,7 +212,7 @@ def profile():
             query = kit.query("nations", {
                 "nation_name": [nation_name],
                 "first": 1
-            }, "id nation_name alliance_id alliance_position")
+            }, "id nation_name alliance_id alliance_position alliance_position_info { name }")
             
             result = query.get()
             
@@ -157,72 +222,297 @@ def profile():
             
             nation = result.nations[0]
             
-            if nation.alliance_id != ALLIANCE_ID:
-                flash(f'You are not a member of our alliance. Your alliance ID: {nation.alliance_id}, Required: {ALLIANCE_ID}', 'danger')
+            if nation.alliance_id not in ALLIANCE_IDS:
+                flash(f'You are not a member of our coalition. Your alliance ID: {nation.alliance_id}, Allowed: {", ".join(map(str, ALLIANCE_IDS))}', 'danger')
                 return render_template('profile.html', user=user)
             
             user.nation_id = nation.id
             user.nation_name = nation.nation_name
-            user.rank = nation.alliance_position if hasattr(nation, 'alliance_position') else 'Member'
+            user.alliance_id = nation.alliance_id
+            user.rank = nation_rank(nation)
             
             if api_key:
                 user.set_api_key(api_key)
             
-            db.session.commit()
-            
-            log = ActivityLog(
-                user_id=user.id,
-                action='Nation Linked',
-                details=f'Linked nation: {nation.nation_name}'
-            )
-            db.session.add(log)
+            log_activity(user.id, 'Nation Linked', f'Linked nation: {nation.nation_name}')
             db.session.commit()
             
             flash('Nation linked successfully!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
             
         except Exception as e:
-            app.logger.error(f"Nation link error: {e}")
+            current_app.logger.error(f"Nation link error: {e}")
             flash(f'Error linking nation: {str(e)}', 'danger')
             return render_template('profile.html', user=user)
     
     return render_template('profile.html', user=user)
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @nation_linked_required
 def dashboard():
-    user = User.query.get(session['user_id'])
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).limit(5).all()
-    
-    inactive_members = get_inactive_members()
-    
-    alliance_wars = get_alliance_wars()
+    user = get_current_user()
+    role = current_role()
+    alliance_id = current_alliance_id()
     
+    # Widgets whose fragment is already cached are rendered inline, the
+    # rest load asynchronously as before.
     return render_template('dashboard.html', 
                          user=user, 
-                         announcements=announcements,
-                         inactive_members=inactive_members,
-                         alliance_wars=alliance_wars,
-                         is_admin=user.rank in ADMIN_RANKS)
+                         announcements_html=render_announcements(role),
+                         inactive_html=fragments.peek('inactive_members', [alliance_id], role),
+                         wars_html=fragments.peek('alliance_wars', [alliance_id], role),
+                         is_admin=role == 'admin',
+                         alliance_id=alliance_id,
+                         alliance_ids=ALLIANCE_IDS)
 
-@app.route('/nations')
+@bp.route('/nations')
 @nation_linked_required
 def nations():
-    user = User.query.get(session['user_id'])
-    nations_data = get_all_nations_data()
-    return render_template('nations.html', user=user, nations=nations_data)
+    user = get_current_user()
+    return render_template('nations.html', user=user, alliance_id=current_alliance_id(),
+                           colors=NATION_COLORS, ranks=['LEADER', 'HEIR', 'OFFICER', 'MEMBER', 'APPLICANT'])
 
-@app.route('/resources')
+@bp.route('/resources')
 @nation_linked_required
 def resources():
-    user = User.query.get(session['user_id'])
-    resource_prices = get_resource_prices()
-    return render_template('resources.html', user=user, prices=resource_prices, now=datetime.utcnow())
+    user = get_current_user()
+    return render_template('resources.html', user=user)
+
+@bp.route('/api/widgets/inactive-members')
+@nation_linked_required
+def inactive_members_widget():
+    alliance_id = current_alliance_id()
+    if request.args.get('format') == 'html':
+        role = current_role()
+        return widget_response('inactive_members', lambda: render_inactive_members(alliance_id, role))
+    return widget_response('inactive_members', lambda: get_inactive_members(alliance_id))
+
+@bp.route('/api/inactivity/trends')
+@nation_linked_required
+def inactivity_trends():
+    days = request.args.get('days', 7, type=int)
+    if not 1 <= days <= current_app.config['INACTIVITY_HISTORY_DAYS']:
+        return jsonify({'success': False, 'message': f"days must be between 1 and {current_app.config['INACTIVITY_HISTORY_DAYS']}"}), 400
+    
+    return jsonify({'success': True, **get_inactivity_trends(current_alliance_id(), days)})
+
+@bp.route('/api/widgets/wars')
+@nation_linked_required
+def wars_widget():
+    alliance_id = current_alliance_id()
+    if request.args.get('format') == 'html':
+        role = current_role()
+        return widget_response('alliance_wars', lambda: render_alliance_wars(alliance_id, role))
+    return widget_response('alliance_wars', lambda: get_alliance_wars(alliance_id))
+
+@bp.route('/wars')
+@nation_linked_required
+def wars():
+    user = get_current_user()
+    return render_template('wars.html', user=user, alliance_id=current_alliance_id(),
+                           war_types=['ORDINARY', 'ATTRITION', 'RAID'])
+
+@bp.route('/api/wars')
+@nation_linked_required
+def list_wars():
+    try:
+        limit = min(max(int(request.args.get('limit', current_app.config['WAR_PAGE_SIZE'])), 1), 500)
+        nation_id = request.args.get('nation_id', type=int)
+        cursor = request.args.get('cursor')
+        after = None
+        if cursor:
+            date, war_id = decode_cursor(cursor)
+            after = (datetime.fromisoformat(date), int(war_id))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid pagination parameters'}), 400
+    
+    status = request.args.get('status', 'active')
+    if status not in ('active', 'ended', 'all'):
+        return jsonify({'success': False, 'message': 'status must be active, ended or all'}), 400
+    
+    wars, next_cursor = get_wars_page(current_alliance_id(), limit, status=status, after=after,
+                                      nation_id=nation_id, war_type=request.args.get('war_type'))
+    return jsonify({'success': True, 'wars': wars, 'next_cursor': next_cursor, 'synced': wars_are_synced()})
+
+@bp.route('/api/widgets/prices')
+@nation_linked_required
+def prices_widget():
+    def load():
+        prices, fetched_at = get_resource_prices()
+        if prices is None:
+            return None
+        return {
+            'prices': {resource: getattr(prices, resource) for resource in RESOURCES if hasattr(prices, resource)},
+            'trends': get_price_trends(),
+            'updated_at': fetched_at.isoformat()
+        }
+    
+    return widget_response('resource_prices', load)
+
+@bp.route('/api/nations')
+@nation_linked_required
+def list_nations():
+    try:
+        query = NationQuery.from_args(request.args, current_app.config['NATION_PAGE_SIZE'], 500)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e) or 'Invalid query parameters'}), 400
+    
+    (nations, next_cursor), total = get_nations_page(current_alliance_id(), query)
+    return jsonify({'success': True, 'nations': nations, 'next_cursor': next_cursor, 'total': total})
+
+@bp.route('/api/widgets/nations')
+@nation_linked_required
+def nations_widget():
+    alliance_id = current_alliance_id()
+    return widget_response('nations', lambda: [serialize_nation(nation) for nation in get_all_nations_data(alliance_id)])
+
+@bp.route('/api/analytics/military')
+@nation_linked_required
+def military_analytics():
+    alliance_id = current_alliance_id()
+    return widget_response('military_analytics', lambda: get_military_analytics(alliance_id))
+
+@bp.route('/api/events')
+@nation_linked_required
+def event_stream():
+    if not events.available:
+        # A non-200 response stops EventSource reconnecting; the dashboard
+        # keeps polling instead.
+        return jsonify({'success': False, 'message': 'Live updates need EVENTS_BACKEND=redis'}), 503
+    
+    alliance_id = current_alliance_id()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    response = Response(events.stream(alliance_id, last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    user = get_current_user()
+    series, quota = metrics.snapshot()
+    return render_template('admin_metrics.html', user=user, series=series, quota=quota,
+                           quota_reset=datetime.utcfromtimestamp(quota['reset']) if quota.get('reset') else None)
+
+@bp.route('/admin/slow-requests')
+@admin_required
+def admin_slow_requests():
+    user = get_current_user()
+    route = request.args.get('route')
+    
+    query = SlowRequest.query
+    if route:
+        query = query.filter_by(route=route)
+    slow_requests = query.order_by(SlowRequest.created_at.desc()).limit(200).all()
+    
+    return render_template('admin_slow_requests.html', user=user, slow_requests=slow_requests, route=route,
+                           profiling_enabled=current_app.config['PROFILING_ENABLED'],
+                           threshold=current_app.config['SLOW_REQUEST_THRESHOLD_MS'])
+
+@bp.route('/admin/activity')
+@admin_required
+def admin_activity():
+    user = get_current_user()
+    return render_template('admin_activity.html', user=user)
+
+@bp.route('/api/admin/activity')
+@admin_required
+def activity_log():
+    try:
+        limit = min(max(int(request.args.get('limit', current_app.config['ACTIVITY_LOG_PAGE_SIZE'])), 1), 500)
+        user_id = request.args.get('user_id', type=int)
+        cursor = request.args.get('cursor')
+        after = None
+        if cursor:
+            created_at, log_id = decode_cursor(cursor)
+            after = (datetime.fromisoformat(created_at), int(log_id))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid pagination parameters'}), 400
+    
+    logs, next_cursor = get_activity_page(limit, after=after, user_id=user_id, action=request.args.get('action'))
+    return jsonify({'success': True, 'logs': logs, 'next_cursor': next_cursor})
+
+def widget_response(name, loader):
+    timeout = current_app.config['DASHBOARD_TIMEOUTS'][name]
+    sections, unavailable = gather_sources(current_app._get_current_object(), dashboard_executor, {name: (loader, timeout)},
+                                           key=(request.full_path, current_role(), current_alliance_id()))
+    
+    if unavailable:
+        response = jsonify({'success': False, 'message': 'Still loading, please retry shortly.'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    
+    response = jsonify({'success': True, 'data': sections[name]})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+def render_component(app, template, **context):
+    # Fragments can also be rebuilt by the cache's background refresh
+    # thread, which has no app context of its own.
+    with app.app_context():
+        return render_template(template, **context)
+
+def render_announcements(role):
+    app = current_app._get_current_object()
+    return fragments.render('announcements', [], role, app.config['FRAGMENT_CACHE_TTL'],
+                            lambda: render_component(app, 'components/announcements.html',
+                                                     announcements=get_recent_announcements(),
+                                                     is_admin=role == 'admin'))
+
+def render_inactive_members(alliance_id, role):
+    app = current_app._get_current_object()
+    return fragments.render('inactive_members', [alliance_id], role, app.config['ROSTER_CACHE_TTL'],
+                            lambda: render_component(app, 'components/inactive_members.html',
+                                                     members=get_inactive_members(alliance_id),
+                                                     is_admin=role == 'admin'))
+
+def render_alliance_wars(alliance_id, role):
+    app = current_app._get_current_object()
+    return fragments.render('alliance_wars', [alliance_id], role, app.config['WARS_CACHE_TTL'],
+                            lambda: render_component(app, 'components/wars_table.html',
+                                                     wars=get_alliance_wars(alliance_id),
+                                                     is_admin=role == 'admin'))
+
+def serialize_war(war, now=None):
+    # The widget reads the synced wars table, or P&W directly until the
+    # first sync, and gets the same shape from both.
+    if isinstance(war, War):
+        attacker, defender, turns_left = war.att_name, war.def_name, war.turns_remaining(now)
+    else:
+        attacker = war.attacker.nation_name if getattr(war, 'attacker', None) else None
+        defender = war.defender.nation_name if getattr(war, 'defender', None) else None
+        turns_left = getattr(war, 'turns_left', None)
+    war_type = getattr(war, 'war_type', None)
+    return {
+        'id': war.id,
+        'war_type': getattr(war_type, 'name', war_type),
+        'attacker': attacker or 'Unknown',
+        'defender': defender or 'Unknown',
+        'turns_left': turns_left
+    }
+
+def serialize_nation(nation):
+    data = {key: getattr(nation, key, None) for key in NATION_FIELDS}
+    last_active = parse_pnw_datetime(data['last_active'])
+    data['last_active'] = last_active.isoformat() if last_active else None
+    data['alliance_position'] = getattr(data['alliance_position'], 'name', data['alliance_position'])
+    return data
 
-@app.route('/api/announcement', methods=['POST'])
+@bp.route('/api/announcement', methods=['POST'])
 @admin_required
 def create_announcement():
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     data = request.json
     
     announcement = Announcement(
@@ -231,35 +521,25 @@ def create_announcement():
         author=user.nation_name or user.discord_username
     )
     db.session.add(announcement)
+    log_activity(user.id, 'Announcement Created', f'Title: {announcement.title}')
     db.session.commit()
-    
-    log = ActivityLog(
-        user_id=user.id,
-        action='Announcement Created',
-        details=f'Title: {announcement.title}'
-    )
-    db.session.add(log)
-    db.session.commit()
+    fragments.invalidate('announcements', [])
+    publish_announcements('created')
     
     return jsonify({'success': True, 'message': 'Announcement created successfully'})
 
-@app.route('/api/announcement/<int:id>', methods=['PUT', 'DELETE'])
+@bp.route('/api/announcement/<int:id>', methods=['PUT', 'DELETE'])
 @admin_required
 def manage_announcement(id):
-    user = User.query.get(session['user_id'])
+    user = get_current_user()
     announcement = Announcement.query.get_or_404(id)
     
     if request.method == 'DELETE':
         db.session.delete(announcement)
+        log_activity(user.id, 'Announcement Deleted', f'Deleted: {announcement.title}')
         db.session.commit()
-        
-        log = ActivityLog(
-            user_id=user.id,
-            action='Announcement Deleted',
-            details=f'Deleted: {announcement.title}'
-        )
-        db.session.add(log)
-        db.session.commit()
+        fragments.invalidate('announcements', [])
+        publish_announcements('deleted')
         
         return jsonify({'success': True, 'message': 'Announcement deleted'})
     
@@ -267,236 +547,907 @@ def manage_announcement(id):
         data = request.json
         announcement.title = data.get('title', announcement.title)
         announcement.content = data.get('content', announcement.content)
+        log_activity(user.id, 'Announcement Updated', f'Updated: {announcement.title}')
         db.session.commit()
-        
-        log = ActivityLog(
-            user_id=user.id,
-            action='Announcement Updated',
-            details=f'Updated: {announcement.title}'
-        )
-        db.session.add(log)
-        db.session.commit()
+        fragments.invalidate('announcements', [])
+        publish_announcements('updated')
         
         return jsonify({'success': True, 'message': 'Announcement updated'})
 
-@app.route('/api/send-resources', methods=['POST'])
+@bp.route('/api/send-resources', methods=['POST'])
 @nation_linked_required
 def send_resources():
-    user = User.query.get(session['user_id'])
+    data = request.json or {}
+    return enqueue_transfers([data], data.get('note'))
+
+@bp.route('/api/send-resources/bulk', methods=['POST'])
+@nation_linked_required
+def send_resources_bulk():
+    data = request.json or {}
+    recipients = data.get('recipients')
+    
+    if not isinstance(recipients, list) or not recipients:
+        return jsonify({'success': False, 'message': 'recipients must be a non-empty list'}), 400
+    if len(recipients) > current_app.config['TRANSFER_MAX_RECIPIENTS']:
+        return jsonify({'success': False, 'message': f"At most {current_app.config['TRANSFER_MAX_RECIPIENTS']} recipients per batch"}), 400
+    
+    return enqueue_transfers(recipients, data.get('note'))
+
+@bp.route('/api/transfers/<batch_id>')
+@nation_linked_required
+def transfer_status(batch_id):
+    user = get_current_user()
+    transfers = BankTransfer.query.filter_by(batch_id=batch_id).order_by(BankTransfer.id).all()
+    
+    if not transfers or (transfers[0].user_id != user.id and user.rank not in ADMIN_RANKS):
+        return jsonify({'success': False, 'message': 'Batch not found'}), 404
+    
+    counts = {}
+    for transfer in transfers:
+        counts[transfer.status] = counts.get(transfer.status, 0) + 1
+    
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'total': len(transfers),
+        'counts': counts,
+        'done': all(transfer.status in ('sent', 'failed') for transfer in transfers),
+        'transfers': [transfer.to_dict() for transfer in transfers]
+    })
+
+def enqueue_transfers(recipients, note=None):
+    user = get_current_user()
     
-    api_key = user.get_api_key()
-    if not api_key:
+    if not getattr(user, 'encrypted_api_key', None):
         return jsonify({'success': False, 'message': 'API key not set. Please update your profile.'}), 400
     
-    data = request.json
-    recipient_id = data.get('recipient_id')
+    batch_id = uuid.uuid4().hex
+    transfers = []
     
-    try:
-        user_kit = pnwkit.QueryKit(api_key)
-        
-        resources = {}
-        resource_fields = ['money', 'food', 'coal', 'oil', 'uranium', 'lead', 
-                          'iron', 'bauxite', 'gasoline', 'munitions', 'steel', 'aluminum']
-        
-        for field in resource_fields:
-            value = float(data.get(field, 0))
-            if value > 0:
-                resources[field] = value
+    for index, item in enumerate(recipients):
+        try:
+            recipient_id = int(item.get('recipient_id'))
+            resources = parse_resources(item, TRANSFER_FIELDS)
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({'success': False, 'message': f'Recipient #{index + 1}: invalid request ({e})'}), 400
         
         if not resources:
-            return jsonify({'success': False, 'message': 'No resources specified'}), 400
-        
-        mutation = user_kit.mutation("bankDeposit", {
-            "receiver": recipient_id,
-            "note": "Sent via Lotus",
-            **resources
-        }, "id")
+            return jsonify({'success': False, 'message': f'Recipient #{index + 1}: no resources specified'}), 400
         
-        result = mutation.get()
-        
-        log = ActivityLog(
+        transfers.append(BankTransfer(
+            batch_id=batch_id,
             user_id=user.id,
-            action='Resources Sent',
-            details=f'To nation {recipient_id}: {resources}'
-        )
-        db.session.add(log)
-        db.session.commit()
-        
-        return jsonify({'success': True, 'message': 'Resources sent successfully'})
-        
-    except Exception as e:
-        app.logger.error(f"Resource send error: {e}")
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+            recipient_id=recipient_id,
+            resources=json.dumps(resources),
+            note=(note or 'Sent via Lotus')[:200]
+        ))
+    
+    db.session.add_all(transfers)
+    log_activity(user.id, 'Resources Queued', f'Batch {batch_id}: {len(transfers)} transfer(s)')
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'message': f'{len(transfers)} transfer(s) queued',
+        'batch_id': batch_id,
+        'status_url': url_for('main.transfer_status', batch_id=batch_id)
+    }), 202
+
+NATION_EXPORT_COLUMNS = [
+    ('Nation Name', 'nation_name'), ('Cities', 'num_cities'), ('Beige Turns', 'beige_turns'),
+    ('Color', 'color'), ('Soldiers', 'soldiers'), ('Tanks', 'tanks'), ('Aircraft', 'aircraft'),
+    ('Ships', 'ships'), ('Missiles', 'missiles'), ('Nukes', 'nukes'), ('Last Active', 'last_active')
+]
 
-@app.route('/api/export-nations')
+PRICE_EXPORT_COLUMNS = [('Resource', 'resource'), ('Price (USD)', 'price')]
+
+@bp.route('/api/export-nations')
 @nation_linked_required
 def export_nations():
-    nations_data = get_all_nations_data()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['Nation Name', 'Cities', 'Beige Turns', 'Color', 'Soldiers', 
-                     'Tanks', 'Aircraft', 'Ships', 'Missiles', 'Nukes', 'Last Active'])
-    
-    for nation in nations_data:
-        writer.writerow([
-            nation.nation_name,
-            nation.num_cities,
-            nation.beige_turns,
-            nation.color,
-            nation.soldiers,
-            nation.tanks,
-            nation.aircraft,
-            nation.ships,
-            nation.missiles,
-            nation.nukes,
-            nation.last_active
-        ])
-    
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'nations_{datetime.utcnow().strftime("%Y%m%d")}.csv'
+    fmt = request.args.get('format', 'csv')
+    error = validate_format(fmt)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    alliance_id = current_alliance_id()
+    rows = (
+        tuple(getattr(nation, key) for _, key in NATION_EXPORT_COLUMNS)
+        for nation in iter_nations_snapshot(alliance_id)
     )
+    
+    return export_response(f'nations_{alliance_id}_{datetime.utcnow().strftime("%Y%m%d")}', NATION_EXPORT_COLUMNS,
+                           rows, fmt, compress=request.args.get('gzip') == '1')
+
+PRICE_HISTORY_EXPORT_COLUMNS = [('Bucket', 'bucket'), ('Resource', 'resource'), ('Min', 'min'),
+                                ('Max', 'max'), ('Average', 'avg'), ('Samples', 'samples')]
 
-@app.route('/api/export-prices')
+PRICE_HISTORY_DEFAULT_SPAN = {
+    'minute': timedelta(hours=6),
+    'hour': timedelta(days=7),
+    'day': timedelta(days=365)
+}
+
+@bp.route('/api/export-prices')
 @nation_linked_required
 def export_prices():
-    prices = get_resource_prices()
+    fmt = request.args.get('format', 'csv')
+    error = validate_format(fmt)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
     
-    output = io.StringIO()
-    writer = csv.writer(output)
+    if 'resolution' in request.args:
+        resolution, start, end, error = parse_history_args()
+        if error:
+            return jsonify({'success': False, 'message': error}), 400
+        
+        resources = [request.args['resource']] if request.args.get('resource') else RESOURCES
+        rollups = PriceRollup.query.filter(
+            PriceRollup.resolution == resolution,
+            PriceRollup.resource.in_(resources),
+            PriceRollup.bucket_start >= start,
+            PriceRollup.bucket_start < end
+        ).order_by(PriceRollup.bucket_start, PriceRollup.resource).yield_per(1000)
+        
+        rows = (
+            (rollup.bucket_start.isoformat(), rollup.resource, rollup.min_price,
+             rollup.max_price, rollup.avg_price, rollup.samples)
+            for rollup in rollups
+        )
+        
+        return export_response(f'prices_{resolution}_{start.strftime("%Y%m%d")}_{end.strftime("%Y%m%d")}',
+                               PRICE_HISTORY_EXPORT_COLUMNS, rows, fmt,
+                               compress=request.args.get('gzip') == '1')
     
-    writer.writerow(['Resource', 'Price (USD)'])
+    prices, _ = get_resource_prices()
     
-    resources = ['food', 'coal', 'oil', 'uranium', 'lead', 'iron', 'bauxite', 
-                'gasoline', 'munitions', 'steel', 'aluminum']
+    rows = (
+        (resource.capitalize(), getattr(prices, resource))
+        for resource in RESOURCES if hasattr(prices, resource)
+    )
     
-    for resource in resources:
-        if hasattr(prices, resource):
-            writer.writerow([resource.capitalize(), getattr(prices, resource)])
+    return export_response(f'prices_{datetime.utcnow().strftime("%Y%m%d")}', PRICE_EXPORT_COLUMNS,
+                           rows, fmt, compress=request.args.get('gzip') == '1')
+
+@bp.route('/api/prices/history')
+@nation_linked_required
+def price_history():
+    resource = request.args.get('resource')
+    if resource not in RESOURCES:
+        return jsonify({'success': False, 'message': f"resource must be one of: {', '.join(RESOURCES)}"}), 400
     
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'prices_{datetime.utcnow().strftime("%Y%m%d")}.csv'
-    )
+    resolution, start, end, error = parse_history_args()
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    
+    return jsonify({
+        'success': True,
+        'resource': resource,
+        'resolution': resolution,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': get_price_history(resource, resolution, start, end)
+    })
 
-def sync_user_rank(user):
+def parse_history_args():
+    resolution = request.args.get('resolution', 'hour')
+    if resolution not in PriceRollup.RESOLUTIONS:
+        return None, None, None, f"resolution must be one of: {', '.join(PriceRollup.RESOLUTIONS)}"
+    
     try:
-        query = kit.query("nations", {
-            "id": user.nation_id,
-            "first": 1
-        }, "alliance_position")
-        
-        result = query.get()
-        
-        if hasattr(result, 'nations') and result.nations:
-            nation = result.nations[0]
-            if hasattr(nation, 'alliance_position'):
-                user.rank = nation.alliance_position
-                db.session.commit()
-    except Exception as e:
-        app.logger.error(f"Error syncing rank for user {user.id}: {e}")
+        end = parse_pnw_datetime(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = (parse_pnw_datetime(request.args['start']) if request.args.get('start')
+                 else end - PRICE_HISTORY_DEFAULT_SPAN[resolution])
+    except ValueError:
+        return None, None, None, 'start and end must be ISO 8601 timestamps'
+    
+    if start >= end:
+        return None, None, None, 'start must be before end'
+    
+    return resolution, start, end, None
 
-def get_inactive_members():
-    try:
-        query = kit.query("nations", {
-            "alliance_id": ALLIANCE_ID,
-            "first": 250
-        }, "nation_name last_active")
-        
-        result = query.get()
-        inactive = []
+def log_activity(user_id, action, details=None):
+    # Added to the caller's session so the log row commits in the same
+    # transaction as the change it describes.
+    db.session.add(ActivityLog(user_id=user_id, action=action, details=details))
+
+def get_activity_page(limit, after=None, user_id=None, action=None):
+    # Keyset pagination over (created_at, id), newest first, so each page
+    # is an index range scan no matter how deep into the log it is.
+    query = db.session.query(ActivityLog, User.nation_name, User.discord_username).join(User)
+    if user_id:
+        query = query.filter(ActivityLog.user_id == user_id)
+    if action:
+        query = query.filter(ActivityLog.action == action)
+    if after:
+        query = query.filter(db.tuple_(ActivityLog.created_at, ActivityLog.id) < after)
+    
+    rows = query.order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc()).limit(limit + 1).all()
+    
+    logs = [{**log.to_dict(), 'user': nation_name or discord_username} for log, nation_name, discord_username in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1][0]
+        next_cursor = encode_cursor(last.created_at.isoformat(), last.id)
+    return logs, next_cursor
+
+def prune_activity_logs():
+    retention = current_app.config['ACTIVITY_LOG_RETENTION_MONTHS']
+    batch_size = current_app.config['ACTIVITY_LOG_PRUNE_BATCH']
+    now = datetime.utcnow()
+    
+    # Whole calendar months are dropped at once, so the oldest month kept
+    # is always complete.
+    months = now.year * 12 + now.month - 1 - retention
+    cutoff = datetime(months // 12, months % 12 + 1, 1)
+    
+    return delete_before(ActivityLog, cutoff, batch_size)
+
+def prune_slow_requests():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['SLOW_REQUEST_RETENTION_DAYS'])
+    return delete_before(SlowRequest, cutoff, current_app.config['ACTIVITY_LOG_PRUNE_BATCH'])
+
+def delete_before(model, cutoff, batch_size):
+    deleted = 0
+    while True:
+        ids = [row_id for row_id, in db.session.query(model.id)
+               .filter(model.created_at < cutoff)
+               .order_by(model.created_at, model.id)
+               .limit(batch_size)]
+        if not ids:
+            break
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+    return deleted
+
+def publish_announcements(action):
+    # The event carries the rendered list itself, so connected clients do
+    # not all come back to the database at once.
+    events.publish('announcement', {
+        'action': action,
+        'announcements': [announcement.to_dict() for announcement in get_recent_announcements()]
+    })
+
+def get_recent_announcements():
+    return Announcement.query.order_by(Announcement.created_at.desc()).limit(5).all()
+
+def nation_rank(nation):
+    # ADMIN_RANKS are the alliance's own position names, which P&W only
+    # exposes through alliance_position_info. alliance_position is the
+    # coarse LEADER/OFFICER/MEMBER enum, kept for nations without one.
+    name = getattr(getattr(nation, 'alliance_position_info', None), 'name', None)
+    if name:
+        return name
+    position = getattr(nation, 'alliance_position', None)
+    return getattr(position, 'name', position)
+
+def sync_ranks():
+    # Ranks gate admin_required, so they are reconciled for every linked
+    # user on a schedule rather than once per login. Nations are looked up
+    # by id in batches and every change lands in one UPDATE.
+    users = db.session.query(User.id, User.nation_id, User.alliance_id, User.rank).filter(
+        User.nation_id.isnot(None)).all()
+    if not users:
+        return 0
+    
+    batch = current_app.config['RANK_SYNC_BATCH']
+    nations = {}
+    for start in range(0, len(users), batch):
+        ids = [user.nation_id for user in users[start:start + batch]]
+        for nation in iter_pages(kit, "nations", {"id": ids}, "id alliance_id alliance_position alliance_position_info { name }",
+                                 per_page=batch, limiter=pnw_limiter):
+            nations[int(nation.id)] = nation
+    
+    ranks = {}
+    alliances = {}
+    deleted = []
+    for user in users:
+        nation = nations.get(user.nation_id)
+        if nation is None:
+            # The nation no longer exists upstream, so the link goes with it
+            # and the user has to link a nation again.
+            deleted.append(user.id)
+            log_activity(user.id, 'Nation Unlinked', f'Nation {user.nation_id} no longer exists')
+            continue
         
-        if not hasattr(result, 'nations'):
-            return inactive
+        alliance_id = nation.alliance_id
+        # Anyone who left the coalition loses their rank along with it.
+        rank = nation_rank(nation) if alliance_id in ALLIANCE_IDS else None
         
-        now_utc = datetime.now(timezone.utc)
+        if rank == user.rank and alliance_id == user.alliance_id:
+            continue
+        ranks[user.id] = rank
+        alliances[user.id] = alliance_id
         
-        for nation in result.nations:
-            try:
-                last_active_str = nation.last_active.replace('Z', '+00:00')
-                last_active = datetime.fromisoformat(last_active_str)
-                
-                days_inactive = (now_utc - last_active).days
-                
-                if days_inactive >= 3:
-                    inactive.append({
-                        'name': nation.nation_name,
-                        'days': days_inactive
-                    })
-            except Exception as e:
-                app.logger.error(f"Error parsing activity for {nation.nation_name}: {e}")
-                continue
+        if alliance_id not in ALLIANCE_IDS and user.alliance_id in ALLIANCE_IDS:
+            log_activity(user.id, 'Left Alliance', f'Nation {user.nation_id} left alliance {user.alliance_id}')
+        elif rank != user.rank:
+            log_activity(user.id, 'Rank Changed', f'{user.rank or "None"} -> {rank or "None"}')
+    
+    if ranks:
+        db.session.execute(db.update(User).where(User.id.in_(ranks)).values(
+            rank=db.case(ranks, value=User.id),
+            alliance_id=db.case(alliances, value=User.id),
+            updated_at=datetime.utcnow()
+        ))
+    if deleted:
+        db.session.execute(db.update(User).where(User.id.in_(deleted)).values(
+            nation_id=None, nation_name=None, alliance_id=None, rank=None, updated_at=datetime.utcnow()
+        ))
+    db.session.commit()
+    return len(ranks) + len(deleted)
+
+def get_inactive_members(alliance_id):
+    try:
+        if not roster_is_synced(alliance_id):
+            now = datetime.utcnow()
+            inactive = []
+            for nation in get_all_nations_data(alliance_id):
+                position = getattr(nation, 'alliance_position', None)
+                days, bucket, is_inactive, _ = inactivity.classify(
+                    parse_pnw_datetime(nation.last_active), getattr(position, 'name', position), now, current_app.config,
+                    vacation=(getattr(nation, 'vacation_mode_turns', None) or 0) > 0)
+                if is_inactive:
+                    inactive.append({'name': nation.nation_name, 'days': days, 'bucket': bucket})
+            return sorted(inactive, key=lambda x: x['days'], reverse=True)
         
-        return sorted(inactive, key=lambda x: x['days'], reverse=True)
+        # The index is maintained by sync_roster, so this is a single range
+        # scan on ix_nations_alliance_inactive with no date parsing.
+        rows = db.session.query(Nation.nation_name, Nation.inactive_days, Nation.inactivity_bucket).filter(
+            Nation.alliance_id == alliance_id,
+            Nation.is_inactive.is_(True)
+        ).order_by(Nation.inactive_days.desc()).all()
+        return [{'name': name, 'days': days, 'bucket': bucket} for name, days, bucket in rows]
     except Exception as e:
-        app.logger.error(f"Error getting inactive members: {e}")
+        current_app.logger.error(f"Error getting inactive members: {e}")
         return []
 
-def get_alliance_wars():
+def partition_by_alliance(name, alliance_id, items, alliances_of, ttl):
+    # One upstream call covers the whole coalition. Every alliance's share
+    # is cached under its own key, so the other alliances' next reads hit.
+    partitions = {aid: [] for aid in ALLIANCE_IDS}
+    for item in items:
+        for aid in set(alliances_of(item)):
+            if aid in partitions:
+                partitions[aid].append(item)
+    
+    for aid, partition in partitions.items():
+        if aid != alliance_id:
+            cache.set(cache.make_key(name, [aid]), partition, ttl)
+    return partitions.get(alliance_id, [])
+
+def get_alliance_wars(alliance_id):
     try:
-        query = kit.query("wars", {
-            "alliance_id": ALLIANCE_ID,
-            "active": True,
-            "first": 100
-        }, "war_type attacker{nation_name} defender{nation_name} turns_left")
+        if wars_are_synced():
+            now = datetime.utcnow()
+            wars = War.query.filter(
+                db.or_(War.att_alliance_id == alliance_id, War.def_alliance_id == alliance_id),
+                War.end_date.is_(None),
+                War.ends_at > now
+            ).order_by(War.ends_at).all()
+            return [serialize_war(war, now) for war in wars]
         
-        result = query.get()
-        return result.wars if hasattr(result, 'wars') else []
+        wars = cache.get_or_set('alliance_wars', [alliance_id],
+                                current_app.config['WARS_CACHE_TTL'], lambda: fetch_alliance_wars(alliance_id))
+        return [serialize_war(war) for war in wars]
     except Exception as e:
-        app.logger.error(f"Error getting wars: {e}")
+        current_app.logger.error(f"Error getting wars: {e}")
         return []
 
-def get_all_nations_data():
+def fetch_alliance_wars(alliance_id):
+    wars = iter_pages(kit, "wars", {"alliance_id": ALLIANCE_IDS, "active": True}, """
+        id war_type att_alliance_id def_alliance_id attacker{nation_name} defender{nation_name} turns_left
+    """, per_page=100, max_workers=current_app.config['PNW_MAX_WORKERS'], limiter=pnw_limiter)
+    
+    return partition_by_alliance('alliance_wars', alliance_id, wars,
+                                 lambda war: (war.att_alliance_id, war.def_alliance_id),
+                                 current_app.config['WARS_CACHE_TTL'])
+
+WAR_FIELDS = """
+    id date end_date reason war_type turns_left att_id def_id att_alliance_id def_alliance_id
+    attacker{nation_name} defender{nation_name} att_points def_points att_resistance def_resistance winner_id
+"""
+
+def wars_are_synced():
+    return db.session.query(War.id).first() is not None
+
+def get_wars_page(alliance_id, limit, status='active', after=None, nation_id=None, war_type=None):
+    now = datetime.utcnow()
+    query = War.query.filter(db.or_(War.att_alliance_id == alliance_id, War.def_alliance_id == alliance_id))
+    
+    if status == 'active':
+        query = query.filter(War.end_date.is_(None), War.ends_at > now)
+    elif status == 'ended':
+        query = query.filter(db.or_(War.end_date.isnot(None), War.ends_at <= now))
+    if nation_id:
+        query = query.filter(db.or_(War.att_id == nation_id, War.def_id == nation_id))
+    if war_type:
+        query = query.filter(War.war_type == war_type)
+    if after:
+        query = query.filter(db.tuple_(War.date, War.id) < after)
+    
+    wars = query.order_by(War.date.desc(), War.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(wars) > limit:
+        last = wars[limit - 1]
+        next_cursor = encode_cursor(last.date.isoformat(), last.id)
+    return [war.to_dict(now) for war in wars[:limit]], next_cursor
+
+def get_nations_page(alliance_id, query):
+    if not roster_is_synced(alliance_id):
+        return query.apply_rows([serialize_nation(nation) for nation in get_all_nations_data(alliance_id)])
+    
+    # Only the requested and sorted columns are selected, so the table view
+    # never pulls columns it doesn't show.
+    names = list(dict.fromkeys(query.fields + [field for field, _ in query.sort]))
+    base = query.filter_sql(Nation.query.filter(Nation.alliance_id == alliance_id), Nation, db)
+    
+    total = None
+    if query.after is None:
+        total = base.with_entities(db.func.count(Nation.id)).scalar()
+    
+    rows = [
+        dict(zip(names, row))
+        for row in query.apply_sql(base.with_entities(*[getattr(Nation, name) for name in names]), Nation, db)
+    ]
+    for row in rows:
+        if row.get('last_active'):
+            row['last_active'] = row['last_active'].isoformat()
+    return query.page(rows), total
+
+def apply_war(war, data, synced_at):
+    war_type = getattr(data, 'war_type', None)
+    war.date = parse_pnw_datetime(data.date)
+    war.end_date = parse_pnw_datetime(getattr(data, 'end_date', None))
+    war.reason = (getattr(data, 'reason', None) or '')[:200]
+    war.war_type = getattr(war_type, 'name', war_type)
+    war.att_id = data.att_id
+    war.def_id = data.def_id
+    war.att_alliance_id = data.att_alliance_id or None
+    war.def_alliance_id = data.def_alliance_id or None
+    war.att_name = data.attacker.nation_name if getattr(data, 'attacker', None) else war.att_name
+    war.def_name = data.defender.nation_name if getattr(data, 'defender', None) else war.def_name
+    war.att_points = data.att_points
+    war.def_points = data.def_points
+    war.att_resistance = data.att_resistance
+    war.def_resistance = data.def_resistance
+    war.winner_id = data.winner_id or None
+    war.set_turns_left(int(data.turns_left or 0), synced_at)
+
+def sync_wars():
+    # New wars come from min_id past the newest stored war, so each run
+    # only pulls what was declared since the last one. Running wars are
+    # refreshed by id for resistance, peace and victories once their data
+    # is WAR_REFRESH_AGE old. A war that ran out its turns gets one last
+    # refresh, after which ends_at equals synced_at and it is left alone.
+    synced_at = datetime.utcnow()
+    stale = synced_at - timedelta(seconds=current_app.config['WAR_REFRESH_AGE'])
+    last_id = db.session.query(db.func.max(War.id)).scalar()
+    
+    arguments = {"alliance_id": ALLIANCE_IDS, "active": False}
+    if last_id is None:
+        arguments["after"] = (synced_at - timedelta(days=current_app.config['WAR_BACKFILL_DAYS'])).isoformat()
+    else:
+        arguments["min_id"] = last_id + 1
+    
+    created = {}
+    touched = set()
+    for data in iter_pages(kit, "wars", arguments, WAR_FIELDS,
+                           max_workers=current_app.config['PNW_MAX_WORKERS'], limiter=pnw_limiter):
+        if data.id in created:
+            continue
+        war = War(id=data.id)
+        apply_war(war, data, synced_at)
+        db.session.add(war)
+        created[data.id] = war
+        touched.update({war.att_alliance_id, war.def_alliance_id})
+    
+    running = [
+        war_id for war_id, in db.session.query(War.id).filter(
+            War.end_date.is_(None),
+            db.or_(
+                db.and_(War.ends_at <= synced_at, War.synced_at < War.ends_at),
+                db.and_(War.ends_at > synced_at, War.synced_at <= stale)
+            )
+        ) if war_id not in created
+    ]
+    
+    batch_size = current_app.config['WAR_REFRESH_BATCH']
+    for start in range(0, len(running), batch_size):
+        batch = running[start:start + batch_size]
+        existing = {war.id: war for war in War.query.filter(War.id.in_(batch))}
+        for data in iter_pages(kit, "wars", {"id": batch, "active": False}, WAR_FIELDS,
+                               max_workers=current_app.config['PNW_MAX_WORKERS'], limiter=pnw_limiter):
+            if data.id in existing:
+                apply_war(existing[data.id], data, synced_at)
+                touched.update({existing[data.id].att_alliance_id, existing[data.id].def_alliance_id})
+    
+    db.session.commit()
+    
+    for alliance_id in touched & set(ALLIANCE_IDS):
+        fragments.invalidate('alliance_wars', [alliance_id])
+    
+    # The first run is a backfill, not news.
+    if last_id is not None:
+        declared = {}
+        for war in created.values():
+            for alliance_id in {war.att_alliance_id, war.def_alliance_id} & set(ALLIANCE_IDS):
+                declared.setdefault(alliance_id, []).append(war.to_dict(synced_at))
+        for alliance_id, wars in declared.items():
+            events.publish('wars', {'new': len(wars), 'wars': wars[:20]}, alliance_id=alliance_id)
+    
+    return {'new': len(created), 'refreshed': len(running)}
+
+def get_all_nations_data(alliance_id):
     try:
-        all_nations = []
-        page = 1
-        has_more = True
+        nations = Nation.query.filter_by(alliance_id=alliance_id).order_by(Nation.nation_name).all()
+        if nations:
+            return nations
+        return cache.get_or_set('all_nations', [alliance_id],
+                                current_app.config['ROSTER_CACHE_TTL'], lambda: fetch_all_nations_data(alliance_id))
+    except Exception as e:
+        current_app.logger.error(f"Error getting nations data: {e}")
+        return []
+
+def fetch_all_nations_data(alliance_id):
+    nations = sorted(iter_all_nations(), key=lambda nation: nation.nation_name)
+    return partition_by_alliance('all_nations', alliance_id, nations,
+                                 lambda nation: (nation.alliance_id,),
+                                 current_app.config['ROSTER_CACHE_TTL'])
+
+def iter_all_nations():
+    return iter_pages(kit, "nations", {"alliance_id": ALLIANCE_IDS}, """
+        id nation_name alliance_id num_cities beige_turns projects soldiers tanks aircraft ships 
+        missiles nukes color last_active alliance_position vacation_mode_turns
+    """, max_workers=current_app.config['PNW_MAX_WORKERS'], limiter=pnw_limiter)
+
+def iter_nations_snapshot(alliance_id):
+    if roster_is_synced(alliance_id):
+        return Nation.query.filter_by(alliance_id=alliance_id).order_by(Nation.nation_name).yield_per(500)
+    return iter(get_all_nations_data(alliance_id))
+
+def roster_is_synced(alliance_id):
+    return db.session.query(Nation.id).filter_by(alliance_id=alliance_id).first() is not None
+
+def parse_pnw_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def sync_roster():
+    synced_at = datetime.utcnow()
+    
+    existing = {nation.id: nation for nation in Nation.query.filter(Nation.alliance_id.in_(ALLIANCE_IDS))}
+    seen = set()
+    changes = {}
+    
+    for data in iter_all_nations():
+        nation = existing.get(data.id) or db.session.get(Nation, data.id)
+        if nation is None:
+            nation = Nation(id=data.id)
+            db.session.add(nation)
+        was_inactive = nation.is_inactive
         
-        while has_more and page <= 5:
-            query = kit.query("nations", {
-                "alliance_id": ALLIANCE_ID,
-                "first": 250,
-                "page": page
-            }, """
-                id nation_name num_cities beige_turns projects soldiers tanks aircraft ships 
-                missiles nukes color last_active alliance_position
-            """)
-            
-            result = query.get()
-            
-            if hasattr(result, 'nations') and result.nations:
-                all_nations.extend(result.nations)
-                has_more = len(result.nations) == 250
-                page += 1
-            else:
-                has_more = False
+        position = getattr(data, 'alliance_position', None)
+        nation.alliance_id = data.alliance_id
+        nation.nation_name = data.nation_name
+        nation.alliance_position = getattr(position, 'name', position)
+        nation.num_cities = data.num_cities
+        nation.beige_turns = data.beige_turns
+        nation.projects = data.projects
+        nation.soldiers = data.soldiers
+        nation.tanks = data.tanks
+        nation.aircraft = data.aircraft
+        nation.ships = data.ships
+        nation.missiles = data.missiles
+        nation.nukes = data.nukes
+        nation.color = data.color
+        nation.last_active = parse_pnw_datetime(data.last_active)
+        nation.synced_at = synced_at
+        seen.add(data.id)
+        
+        days, bucket, is_inactive, inactive_since = inactivity.classify(
+            nation.last_active, nation.alliance_position, synced_at, current_app.config,
+            vacation=(data.vacation_mode_turns or 0) > 0)
+        nation.inactive_days = days
+        nation.inactivity_bucket = bucket
+        nation.is_inactive = is_inactive
+        nation.inactive_since = inactive_since
+        
+        if was_inactive is not None and was_inactive != is_inactive:
+            status = 'inactive' if is_inactive else 'active'
+            changes.setdefault(nation.alliance_id, {'inactive': [], 'active': []})[status].append(nation.nation_name)
+            db.session.add(InactivityChange(
+                nation_id=nation.id,
+                alliance_id=nation.alliance_id,
+                nation_name=nation.nation_name,
+                status=status,
+                inactive_days=days or 0,
+                changed_at=synced_at
+            ))
+    
+    if not seen:
+        db.session.rollback()
+        return 0
+    
+    for nation_id, nation in existing.items():
+        if nation_id not in seen:
+            db.session.delete(nation)
+    
+    db.session.flush()
+    record_inactivity_daily(synced_at)
+    db.session.commit()
+    
+    for alliance_id in ALLIANCE_IDS:
+        fragments.invalidate('inactive_members', [alliance_id])
+    
+    for alliance_id, change in changes.items():
+        events.publish('inactivity', change, alliance_id=alliance_id)
+    return len(seen)
+
+def record_inactivity_daily(now):
+    # Today's row per (alliance, bucket) is rewritten on every sync, so it
+    # ends up holding the last state of the day.
+    today = now.date()
+    counts = db.session.query(
+        Nation.alliance_id,
+        Nation.inactivity_bucket,
+        db.func.count(Nation.id),
+        db.func.sum(db.case((Nation.is_inactive.is_(True), 1), else_=0))
+    ).filter(
+        Nation.alliance_id.in_(ALLIANCE_IDS),
+        Nation.inactivity_bucket.isnot(None)
+    ).group_by(Nation.alliance_id, Nation.inactivity_bucket).all()
+    
+    InactivityDaily.query.filter(InactivityDaily.day == today).delete(synchronize_session=False)
+    db.session.add_all([
+        InactivityDaily(alliance_id=alliance_id, day=today, bucket=bucket, members=members, inactive=inactive or 0)
+        for alliance_id, bucket, members, inactive in counts
+    ])
+    
+    cutoff = now - timedelta(days=current_app.config['INACTIVITY_HISTORY_DAYS'])
+    InactivityDaily.query.filter(InactivityDaily.day < cutoff.date()).delete(synchronize_session=False)
+    InactivityChange.query.filter(InactivityChange.changed_at < cutoff).delete(synchronize_session=False)
+
+def get_inactivity_trends(alliance_id, days):
+    since = datetime.utcnow() - timedelta(days=days)
+    
+    changes = InactivityChange.query.filter(
+        InactivityChange.alliance_id == alliance_id,
+        InactivityChange.changed_at >= since
+    ).order_by(InactivityChange.changed_at.desc()).all()
+    
+    history = InactivityDaily.query.filter(
+        InactivityDaily.alliance_id == alliance_id,
+        InactivityDaily.day >= since.date()
+    ).order_by(InactivityDaily.day, InactivityDaily.bucket).all()
+    
+    return {
+        'went_inactive': [change.to_dict() for change in changes if change.status == 'inactive'],
+        'returned': [change.to_dict() for change in changes if change.status == 'active'],
+        'history': [row.to_dict() for row in history],
+        'buckets': current_app.config['INACTIVITY_BUCKETS']
+    }
+
+def get_price_history(resource, resolution, start, end):
+    rollups = PriceRollup.query.filter(
+        PriceRollup.resolution == resolution,
+        PriceRollup.resource == resource,
+        PriceRollup.bucket_start >= start,
+        PriceRollup.bucket_start < end
+    ).order_by(PriceRollup.bucket_start).all()
+    return [rollup.to_dict() for rollup in rollups]
+
+def get_price_trends():
+    day_ago = PriceRollup.bucket_for(datetime.utcnow() - timedelta(days=1), 'hour')
+    current = PriceRollup.bucket_for(datetime.utcnow(), 'hour')
+    
+    rollups = PriceRollup.query.filter(
+        PriceRollup.resolution == 'hour',
+        PriceRollup.bucket_start.in_([day_ago, current])
+    ).all()
+    
+    averages = {(rollup.resource, rollup.bucket_start): rollup.avg_price for rollup in rollups}
+    trends = {}
+    for resource in RESOURCES:
+        before = averages.get((resource, day_ago))
+        now = averages.get((resource, current))
+        if before and now is not None:
+            trends[resource] = round((now - before) / before * 100, 2)
+    return trends
+
+def collect_prices():
+    prices = fetch_resource_prices()
+    if prices is None:
+        return 0
+    
+    recorded_at = datetime.utcnow()
+    values = {resource: float(getattr(prices, resource)) for resource in RESOURCES if hasattr(prices, resource)}
+    db.session.add(PriceSnapshot(recorded_at=recorded_at, **values))
+    
+    buckets = {resolution: PriceRollup.bucket_for(recorded_at, resolution) for resolution in PriceRollup.RESOLUTIONS}
+    existing = {
+        (rollup.resolution, rollup.resource): rollup
+        for rollup in PriceRollup.query.filter(
+            db.or_(*[db.and_(PriceRollup.resolution == resolution, PriceRollup.bucket_start == bucket)
+                     for resolution, bucket in buckets.items()])
+        )
+    }
+    
+    for resolution, bucket in buckets.items():
+        for resource, price in values.items():
+            rollup = existing.get((resolution, resource))
+            if rollup is None:
+                rollup = PriceRollup(resolution=resolution, resource=resource, bucket_start=bucket)
+                db.session.add(rollup)
+            rollup.add_sample(price)
+    
+    cutoff = recorded_at - timedelta(days=current_app.config['PRICE_RAW_RETENTION_DAYS'])
+    PriceSnapshot.query.filter(PriceSnapshot.recorded_at < cutoff).delete(synchronize_session=False)
+    PriceRollup.query.filter(
+        PriceRollup.resolution == 'minute',
+        PriceRollup.bucket_start < cutoff
+    ).delete(synchronize_session=False)
+    
+    db.session.commit()
+    cache.set(cache.make_key('trade_prices', []), (prices, recorded_at), current_app.config['PRICES_CACHE_TTL'])
+    return len(values)
+
+def get_military_analytics(alliance_id):
+    app = current_app._get_current_object()
+    return cache.get_or_set('military_analytics', [alliance_id],
+                            app.config['ROSTER_CACHE_TTL'], lambda: compute_military_analytics(app, alliance_id))
+
+def compute_military_analytics(app, alliance_id):
+    with app.app_context():
+        if roster_is_synced(alliance_id):
+            rows = db.session.query(
+                *[getattr(Nation, field) for field in analytics.FIELDS], Nation.color
+            ).filter_by(alliance_id=alliance_id).all()
+        else:
+            rows = [
+                tuple(getattr(nation, field, None) for field in analytics.FIELDS) + (getattr(nation, 'color', None),)
+                for nation in get_all_nations_data(alliance_id)
+            ]
         
-        return all_nations
+        return analytics.summarize(analytics.load_columns(rows))
+
+def process_transfers():
+    now = datetime.utcnow()
+    
+    stale = now - timedelta(seconds=current_app.config['TRANSFER_STALE_SECONDS'])
+    BankTransfer.query.filter(
+        BankTransfer.status == 'running',
+        BankTransfer.updated_at < stale
+    ).update({
+        'status': 'failed',
+        'last_error': f'Interrupted while sending. {CHECK_BANK}'
+    }, synchronize_session=False)
+    
+    query = BankTransfer.query.filter(
+        BankTransfer.status == 'pending',
+        BankTransfer.next_attempt_at <= now
+    ).order_by(BankTransfer.id).limit(current_app.config['TRANSFER_BATCH_SIZE'])
+    if db.engine.dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    
+    transfers = query.all()
+    for transfer in transfers:
+        transfer.status = 'running'
+    db.session.commit()
+    
+    for transfer in transfers:
+        execute_transfer(transfer)
+        db.session.commit()
+    
+    return len(transfers)
+
+def execute_transfer(transfer):
+    user_kit = user_kits.get(transfer.user)
+    if user_kit is None:
+        transfer.status = 'failed'
+        transfer.last_error = 'API key not set or could not be decrypted.'
+        return
+    
+    resources = transfer.get_resources()
+    transfer_bucket.acquire()
+    
+    try:
+        user_kit.mutation("bankDeposit", {
+            "receiver": transfer.recipient_id,
+            "note": transfer.note,
+            **resources
+        }, "id").get()
     except Exception as e:
-        app.logger.error(f"Error getting nations data: {e}")
-        return []
+        current_app.logger.error(f"Resource send error for transfer {transfer.id}: {e}")
+        transfer.attempts += 1
+        
+        if never_sent(e) and transfer.attempts < current_app.config['TRANSFER_MAX_ATTEMPTS']:
+            transfer.status = 'pending'
+            transfer.last_error = str(e)[:1000]
+            transfer.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(
+                transfer.attempts, current_app.config['TRANSFER_BACKOFF_BASE'], current_app.config['TRANSFER_BACKOFF_MAX']))
+            return
+        
+        transfer.status = 'failed'
+        rejection = graphql_error(e)
+        if rejection is not None:
+            # P&W answered and refused it, e.g. for insufficient funds.
+            transfer.last_error = str(rejection)[:1000]
+        elif never_sent(e):
+            transfer.last_error = str(e)[:1000]
+        else:
+            # The deposit may have gone through, so it is never sent again.
+            transfer.last_error = f'Send failed with an unknown outcome ({str(e)[:800]}). {CHECK_BANK}'
+        return
+    
+    transfer.status = 'sent'
+    transfer.attempts += 1
+    transfer.last_error = None
+    log_activity(transfer.user_id, 'Resources Sent', f'To nation {transfer.recipient_id}: {resources}')
 
 def get_resource_prices():
+    # Cached with the time they were fetched (or recorded by collect_prices)
+    # so pages can show how old the prices really are.
     try:
-        query = kit.query("tradeprices", {}, """
-            food coal oil uranium lead iron bauxite gasoline munitions steel aluminum
-        """)
-        
-        result = query.get()
-        return result.tradeprices[0] if hasattr(result, 'tradeprices') and result.tradeprices else None
+        return cache.get_or_set('trade_prices', [], current_app.config['PRICES_CACHE_TTL'],
+                                lambda: (fetch_resource_prices(), datetime.utcnow()))
     except Exception as e:
-        app.logger.error(f"Error getting prices: {e}")
-        return None
+        current_app.logger.error(f"Error getting prices: {e}")
+        return None, None
+
+def fetch_resource_prices():
+    query = kit.query("tradeprices", {}, """
+        food coal oil uranium lead iron bauxite gasoline munitions steel aluminum
+    """)
+    
+    result = query.get()
+    return result.tradeprices[0] if hasattr(result, 'tradeprices') and result.tradeprices else None
+
+def engine_options(config):
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE']
+    }
+    # SQLite uses a single-connection pool that takes no sizing arguments.
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT']
+        })
+    return options
+
+def create_app(config=Config):
+    app = Flask(__name__, template_folder='Templates', static_folder='Templates/Static', static_url_path='/static')
+    app.config.from_object(config)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    
+    db.init_app(app)
+    app.register_blueprint(bp)
+    init_profiling(app, db, SlowRequest, current_user_is_admin)
+    init_assets(app)
+    
+    # With gunicorn --preload the app is built before workers fork. Pooled
+    # connections opened by then belong to the parent, so each child drops
+    # them (without closing the parent's sockets) and opens its own.
+    def dispose_engines():
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+    
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=dispose_engines)
+    
+    return app
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
     app.run(host='0.0.0.0', port=5000, debug=True)
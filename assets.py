@@ -0,0 +1,270 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from urllib.parse import urljoin
+
+import requests
+from flask import request, send_file, url_for, abort
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Templates', 'Static')
+VENDOR_DIR = os.path.join(STATIC_DIR, 'vendor')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+# Same versions base.html used to pull from the CDNs, keyed by where they
+# land under Static/vendor.
+VENDOR = {
+    'bootstrap/bootstrap.min.css': 'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css',
+    'bootstrap/bootstrap.min.js': 'https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/js/bootstrap.min.js',
+    'datatables/dataTables.bootstrap4.min.css': 'https://cdn.datatables.net/1.10.24/css/dataTables.bootstrap4.min.css',
+    'datatables/jquery.dataTables.min.js': 'https://cdn.datatables.net/1.10.24/js/jquery.dataTables.min.js',
+    'datatables/dataTables.bootstrap4.min.js': 'https://cdn.datatables.net/1.10.24/js/dataTables.bootstrap4.min.js',
+    'fixedcolumns/fixedColumns.bootstrap4.min.css': 'https://cdn.datatables.net/fixedcolumns/3.3.2/css/fixedColumns.bootstrap4.min.css',
+    'fixedcolumns/dataTables.fixedColumns.min.js': 'https://cdn.datatables.net/fixedcolumns/3.3.2/js/dataTables.fixedColumns.min.js',
+    'fontawesome/css/all.min.css': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css',
+    'jquery/jquery.min.js': 'https://code.jquery.com/jquery-3.5.1.min.js',
+    'popper/popper.min.js': 'https://cdn.jsdelivr.net/npm/popper.js@1.16.1/dist/umd/popper.min.js',
+}
+
+BUNDLES = {
+    'app.css': [
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/datatables/dataTables.bootstrap4.min.css',
+        'vendor/fixedcolumns/fixedColumns.bootstrap4.min.css',
+        'vendor/fontawesome/css/all.min.css',
+        'css/template.css',
+    ],
+    'app.js': [
+        'vendor/jquery/jquery.min.js',
+        'vendor/popper/popper.min.js',
+        'vendor/bootstrap/bootstrap.min.js',
+        'vendor/datatables/jquery.dataTables.min.js',
+        'vendor/datatables/dataTables.bootstrap4.min.js',
+        'vendor/fixedcolumns/dataTables.fixedColumns.min.js',
+        'js/Template.js',
+    ],
+}
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def _local_ref(ref):
+    # Relative references only; data URIs and absolute URLs stay as they are.
+    return not re.match(r'^(data:|[a-z]+://|/|#)', ref, re.I)
+
+
+def _split_ref(ref):
+    match = re.match(r'^([^?#]*)(.*)$', ref)
+    return match.group(1), match.group(2)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _fingerprint(name, content):
+    base, ext = os.path.splitext(name)
+    return f'{base}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def fetch(refresh=False, timeout=30):
+    # Downloads each vendor file once, plus whatever fonts and images its
+    # CSS points at, so the bundle never depends on a CDN at runtime.
+    session = requests.Session()
+    fetched = 0
+
+    def download(url, path):
+        nonlocal fetched
+        if os.path.exists(path) and not refresh:
+            with open(path, 'rb') as f:
+                return f.read()
+        response = session.get(url, timeout=timeout)
+        response.raise_for_status()
+        _write(path, response.content)
+        fetched += 1
+        return response.content
+
+    for name, url in VENDOR.items():
+        path = os.path.join(VENDOR_DIR, name)
+        content = download(url, path)
+        if not name.endswith('.css'):
+            continue
+        for _, ref in CSS_URL.findall(content.decode('utf-8')):
+            if _local_ref(ref):
+                target, _ = _split_ref(ref)
+                download(urljoin(url, target), os.path.normpath(os.path.join(os.path.dirname(path), target)))
+
+    return fetched
+
+
+def minify_css(source):
+    return rcssmin.cssmin(source)
+
+
+def minify_js(source):
+    return rjsmin.jsmin(source)
+
+
+def _bundle_css(sources, emitted):
+    parts = []
+    for source in sources:
+        path = os.path.join(STATIC_DIR, source)
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+
+        def rewrite(match):
+            ref = match.group(2)
+            if not _local_ref(ref):
+                return match.group(0)
+            target, suffix = _split_ref(ref)
+            asset = os.path.normpath(os.path.join(os.path.dirname(path), target))
+            with open(asset, 'rb') as f:
+                data = f.read()
+            name = _fingerprint(os.path.basename(asset), data)
+            if name not in emitted:
+                _write(os.path.join(DIST_DIR, name), data)
+                emitted.add(name)
+            return f'url({name}{suffix})'
+
+        content = CSS_URL.sub(rewrite, content)
+        parts.append(content if source.endswith('.min.css') else minify_css(content))
+    return '\n'.join(parts)
+
+
+def _bundle_js(sources):
+    parts = []
+    for source in sources:
+        with open(os.path.join(STATIC_DIR, source), encoding='utf-8') as f:
+            content = f.read()
+        parts.append(content if source.endswith('.min.js') else minify_js(content))
+    # A leading semicolon guards against files that end without one.
+    return '\n;'.join(parts)
+
+
+def check_build():
+    # Only the build needs these; the app imports this module just to serve
+    # what it produced.
+    missing = [name for name, module in (('brotli', brotli), ('rcssmin', rcssmin), ('rjsmin', rjsmin))
+               if module is None]
+    if missing:
+        raise RuntimeError(f"Missing {', '.join(missing)}, install them with: pip install -r requirements.txt")
+
+    sources = {source for sources in BUNDLES.values() for source in sources}
+    missing = sorted(source for source in sources if not os.path.exists(os.path.join(STATIC_DIR, source)))
+    if missing:
+        raise RuntimeError(f"Missing {', '.join(missing)}, run: python assets.py --fetch")
+
+
+def build():
+    check_build()
+    manifest = {}
+    emitted = set()
+    for name, sources in BUNDLES.items():
+        if name.endswith('.css'):
+            content = _bundle_css(sources, emitted).encode('utf-8')
+        else:
+            content = _bundle_js(sources).encode('utf-8')
+
+        filename = _fingerprint(name, content)
+        path = os.path.join(DIST_DIR, filename)
+        _write(path, content)
+        _write(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        _write(path + '.br', brotli.compress(content, quality=11))
+        manifest[name] = filename
+
+    # Earlier builds are left in place so pages rendered before a deploy
+    # can still load the files they reference.
+    _write(MANIFEST, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def serve_asset(filename):
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+            response = send_file(path + suffix, mimetype=mimetype, conditional=True)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(path, mimetype=mimetype, conditional=True)
+
+    # File names change with their content, so they never need revalidating.
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def init_assets(app):
+    # Without a build, base.html falls back to the CDN tags and the plain
+    # files under Static/.
+    manifest = load_manifest()
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+
+    @app.context_processor
+    def inject_asset_url():
+        def asset_url(name):
+            return url_for('assets', filename=manifest[name]) if name in manifest else None
+        return {'asset_url': asset_url}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the Lotus static asset bundles')
+    parser.add_argument('--fetch', action='store_true', help='download missing vendor files first')
+    parser.add_argument('--refresh', action='store_true', help='re-download every vendor file')
+    args = parser.parse_args()
+
+    if args.fetch or args.refresh:
+        print(f"Fetched {fetch(refresh=args.refresh)} vendor files into {VENDOR_DIR}")
+
+    try:
+        manifest = build()
+    except RuntimeError as e:
+        parser.exit(1, f"{e}\n")
+
+    for name, filename in manifest.items():
+        size = os.path.getsize(os.path.join(DIST_DIR, filename))
+        compressed = ', '.join(
+            f"{suffix[1:]} {os.path.getsize(os.path.join(DIST_DIR, filename + suffix)) / 1024:.1f} KB"
+            for _, suffix in ENCODINGS if os.path.exists(os.path.join(DIST_DIR, filename + suffix))
+        )
+        print(f"{name} -> {filename} ({size / 1024:.1f} KB, {compressed})")
+
+
+if __name__ == '__main__':
+    main()
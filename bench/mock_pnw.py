@@ -0,0 +1,306 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, jsonify, request
+
+TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?|\$?\w+|[{}()\[\]:]')
+
+POSITIONS = ['MEMBER'] * 12 + ['OFFICER'] * 3 + ['HEIR', 'LEADER', 'APPLICANT']
+# Custom position names an alliance might give each built-in level.
+POSITION_NAMES = {'LEADER': 'Shogun', 'HEIR': 'Daimyo', 'OFFICER': 'Bushido', 'MEMBER': 'Samurai',
+                  'APPLICANT': 'Ronin'}
+COLORS = ['red', 'blue', 'green', 'black', 'white', 'purple', 'orange', 'yellow', 'beige']
+WAR_TYPES = ['ORDINARY', 'ATTRITION', 'RAID']
+PRICES = {
+    'food': 120, 'coal': 3800, 'oil': 3900, 'uranium': 3100, 'lead': 4000, 'iron': 3900,
+    'bauxite': 4000, 'gasoline': 3500, 'munitions': 2100, 'steel': 4300, 'aluminum': 2600
+}
+
+
+def parse_document(text, variables):
+    tokens = [token for token in TOKEN.findall(text)]
+    start = tokens.index('{')
+    operation = tokens[0] if tokens[0] in ('query', 'mutation') else 'query'
+    selection, _ = parse_selection(tokens, start + 1, variables)
+    return operation, selection
+
+
+def parse_selection(tokens, i, variables):
+    fields = {}
+    while tokens[i] != '}':
+        name = tokens[i]
+        i += 1
+        args = {}
+        if tokens[i] == '(':
+            i += 1
+            while tokens[i] != ')':
+                key = tokens[i]
+                args[key], i = parse_value(tokens, i + 2, variables)
+            i += 1
+        children = None
+        if tokens[i] == '{':
+            children, i = parse_selection(tokens, i + 1, variables)
+        fields[name] = (args, children)
+    return fields, i + 1
+
+
+def parse_value(tokens, i, variables):
+    token = tokens[i]
+    if token == '[':
+        values = []
+        i += 1
+        while tokens[i] != ']':
+            value, i = parse_value(tokens, i, variables)
+            values.append(value)
+        return values, i + 1
+    if token.startswith('$'):
+        return variables.get(token[1:]), i + 1
+    if token.startswith('"'):
+        return json.loads(token), i + 1
+    if token in ('true', 'false', 'null'):
+        return {'true': True, 'false': False, 'null': None}[token], i + 1
+    try:
+        return (float(token) if '.' in token or 'e' in token.lower() else int(token)), i + 1
+    except ValueError:
+        return token, i + 1
+
+
+def project(record, selection, typename):
+    # Shapes a synthetic record to exactly the fields the query asked for,
+    # the way the real API does.
+    result = {}
+    for name, (_, children) in selection.items():
+        if name == '__typename':
+            result[name] = typename
+        elif children is not None and record.get(name) is not None:
+            result[name] = project(record[name], children, 'Nation')
+        else:
+            result[name] = record.get(name)
+    return result
+
+
+def as_list(value):
+    if value is None:
+        return None
+    return value if isinstance(value, list) else [value]
+
+
+class Universe:
+    # Nations are derived from their id on demand, so a 50k roster costs
+    # nothing until a page of it is requested.
+    def __init__(self, nations, wars, alliance_ids, seed=0):
+        self.nations = nations
+        self.alliance_ids = alliance_ids
+        self.seed = seed
+        self.now = datetime.now(timezone.utc)
+        self.wars = [self.make_war(i) for i in range(1, wars + 1)]
+
+    def alliance_of(self, nation_id):
+        return self.alliance_ids[(nation_id - 1) % len(self.alliance_ids)]
+
+    def nation(self, nation_id):
+        rng = random.Random(self.seed * 1000003 + nation_id)
+        cities = rng.randint(5, 40)
+        inactive = rng.random() < 0.15
+        last_active = self.now - (timedelta(days=rng.uniform(3, 30)) if inactive else timedelta(hours=rng.uniform(0, 48)))
+        position = rng.choice(POSITIONS)
+        return {
+            'id': str(nation_id),
+            'nation_name': f'Nation {nation_id}',
+            'leader_name': f'Leader {nation_id}',
+            'alliance_id': str(self.alliance_of(nation_id)),
+            'alliance_position': position,
+            'alliance_position_info': {'id': str(POSITIONS.index(position)), 'name': POSITION_NAMES[position]},
+            'color': rng.choice(COLORS),
+            'score': round(cities * 75 + rng.uniform(0, 1500), 2),
+            'num_cities': cities,
+            'beige_turns': rng.choice([0] * 9 + [rng.randint(1, 24)]),
+            'vacation_mode_turns': 0,
+            'projects': rng.randint(0, 20),
+            'soldiers': rng.randint(0, cities * 15000),
+            'tanks': rng.randint(0, cities * 1250),
+            'aircraft': rng.randint(0, cities * 75),
+            'ships': rng.randint(0, cities * 15),
+            'missiles': rng.randint(0, 20),
+            'nukes': rng.randint(0, 10),
+            'spies': rng.randint(0, 60),
+            'last_active': last_active.isoformat(),
+            'date': (self.now - timedelta(days=rng.randint(30, 3000))).isoformat()
+        }
+
+    def nation_ids(self, args):
+        ids = as_list(args.get('id'))
+        names = as_list(args.get('nation_name'))
+        alliances = as_list(args.get('alliance_id'))
+        
+        if ids is not None:
+            candidates = [int(nation_id) for nation_id in ids]
+        elif names is not None:
+            candidates = [int(name.rsplit(' ', 1)[-1]) for name in names if name.rsplit(' ', 1)[-1].isdigit()]
+        else:
+            candidates = range(1, self.nations + 1)
+        
+        candidates = [nation_id for nation_id in candidates if 1 <= nation_id <= self.nations]
+        if alliances is not None:
+            alliances = {int(alliance_id) for alliance_id in alliances}
+            candidates = [nation_id for nation_id in candidates if self.alliance_of(nation_id) in alliances]
+        return candidates
+
+    def make_war(self, war_id):
+        rng = random.Random(self.seed * 7919 + war_id)
+        attacker = self.nation(rng.randint(1, self.nations))
+        defender = self.nation(rng.randint(1, self.nations))
+        started = self.now - timedelta(hours=rng.uniform(0, 240))
+        turns_left = max(0, 60 - int((self.now - started).total_seconds() // 7200))
+        return {
+            'id': str(war_id),
+            'date': started.isoformat(),
+            'end_date': None if turns_left else (started + timedelta(days=5)).isoformat(),
+            'reason': 'Synthetic war',
+            'war_type': rng.choice(WAR_TYPES),
+            'turns_left': turns_left,
+            'att_id': attacker['id'],
+            'def_id': defender['id'],
+            'att_alliance_id': attacker['alliance_id'],
+            'def_alliance_id': defender['alliance_id'],
+            'attacker': attacker,
+            'defender': defender,
+            'att_points': rng.randint(0, 12),
+            'def_points': rng.randint(0, 12),
+            'att_resistance': rng.randint(0, 100),
+            'def_resistance': rng.randint(0, 100),
+            'ground_control': '0',
+            'air_superiority': '0',
+            'naval_blockade': '0',
+            'winner_id': '0'
+        }
+
+    def resolve(self, field, args):
+        if field == 'nations':
+            return 'Nation', self.nation_ids(args), self.nation
+        if field == 'wars':
+            alliances = {int(alliance_id) for alliance_id in as_list(args.get('alliance_id')) or []}
+            ids = {int(war_id) for war_id in as_list(args.get('id')) or []}
+            min_id = int(args.get('min_id') or 0)
+            after = args.get('after')
+            wars = [
+                war for war in self.wars
+                if (not alliances or int(war['att_alliance_id']) in alliances or int(war['def_alliance_id']) in alliances)
+                and (not ids or int(war['id']) in ids)
+                and int(war['id']) >= min_id
+                and (not after or war['date'] >= after)
+                and (not args.get('active', True) or war['turns_left'] > 0)
+            ]
+            return 'War', wars, lambda war: war
+        if field == 'tradeprices':
+            prices = {resource: round(price * random.uniform(0.95, 1.05), 2) for resource, price in PRICES.items()}
+            return 'Tradeprice', [{'id': '1', 'date': self.now.date().isoformat(), **prices}], lambda item: item
+        raise KeyError(field)
+
+
+def create_mock_app(nations=1000, wars=200, alliance_ids=(1,), latency=0.0, jitter=0.0, seed=0):
+    app = Flask('mock_pnw')
+    universe = Universe(nations, wars, list(alliance_ids), seed)
+    persisted = {}
+    lock = threading.Lock()
+    stats = {'requests': 0}
+    deposits = []
+    app.config['UNIVERSE'] = universe
+    app.config['STATS'] = stats
+    app.config['DEPOSITS'] = deposits
+
+    @app.route('/graphql', methods=['GET', 'POST'])
+    def graphql():
+        with lock:
+            stats['requests'] += 1
+        
+        if request.method == 'POST':
+            body = request.get_json()
+            text, variables = body['query'], body.get('variables') or {}
+            with lock:
+                persisted[hashlib.sha256(text.encode()).hexdigest()] = text
+        else:
+            digest = json.loads(request.args['extensions'])['persistedQuery']['sha256Hash']
+            variables = json.loads(request.args.get('variables') or '{}')
+            with lock:
+                text = persisted.get(digest)
+            if text is None:
+                return jsonify({'errors': [{'message': 'PersistedQueryNotFound',
+                                            'extensions': {'code': 'PERSISTED_QUERY_NOT_FOUND'}}]})
+        
+        if latency or jitter:
+            time.sleep(latency + random.uniform(0, jitter))
+        
+        operation, selection = parse_document(text, variables)
+        # Lets tests make mutations fail the way P&W can: 'rejected' is a
+        # GraphQL error after nothing moved, 'server_error' a 502 after the
+        # deposit may already have been applied.
+        fault = app.config.get('MUTATION_FAULT')
+        if operation == 'mutation' and fault == 'rejected':
+            return jsonify({'errors': [{'message': 'You do not have enough resources to send that.',
+                                        'extensions': {'category': 'graphql'}}]})
+        if operation == 'mutation' and fault == 'server_error':
+            with lock:
+                deposits.extend(args for args, _ in selection.values())
+            return '<html>502 Bad Gateway</html>', 502
+        
+        data = {}
+        try:
+            for field, (args, children) in selection.items():
+                if operation == 'mutation':
+                    with lock:
+                        deposits.append(args)
+                    data[field] = project({'id': str(random.randint(1, 10 ** 9)), **args}, children, 'Bankrec')
+                    continue
+                
+                typename, items, build = universe.resolve(field, args)
+                per_page = int(args.get('first') or 50)
+                page = int(args.get('page') or 1)
+                last_page = max(1, (len(items) + per_page - 1) // per_page)
+                chunk = items[(page - 1) * per_page:page * per_page]
+                data[field] = project({
+                    'data': None,
+                    'paginatorInfo': {
+                        'count': len(chunk), 'currentPage': page, 'firstItem': (page - 1) * per_page + 1,
+                        'hasMorePages': page < last_page, 'lastItem': (page - 1) * per_page + len(chunk),
+                        'lastPage': last_page, 'perPage': per_page, 'total': len(items)
+                    }
+                }, {'__typename': ({}, None), 'paginatorInfo': children['paginatorInfo']}, f'{typename}Paginator')
+                data[field]['paginatorInfo']['__typename'] = 'PaginatorInfo'
+                data[field]['data'] = [project(build(item), children['data'][1], typename) for item in chunk]
+        except KeyError as e:
+            return jsonify({'errors': [{'message': f'Unknown field {e}', 'extensions': {'code': 'GRAPHQL_VALIDATION_FAILED'}}]})
+        
+        response = jsonify({'data': data})
+        response.headers['X-RateLimit-Limit'] = '10000'
+        response.headers['X-RateLimit-Remaining'] = str(max(0, 10000 - stats['requests']))
+        response.headers['X-RateLimit-Reset'] = str(int(time.time()) + 60)
+        response.headers['X-RateLimit-Interval'] = '60'
+        return response
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the P&W GraphQL API')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--nations', type=int, default=1000, help='roster size (250 to 50000 is typical)')
+    parser.add_argument('--wars', type=int, default=200)
+    parser.add_argument('--alliance-ids', default='1', help='comma separated alliance ids to spread nations across')
+    parser.add_argument('--latency', type=float, default=0.05, help='fixed seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds added to every response')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    app = create_mock_app(args.nations, args.wars, [int(i) for i in args.alliance_ids.split(',')],
+                          args.latency, args.jitter, args.seed)
+    app.run(host='127.0.0.1', port=args.port, threaded=True)
+
+if __name__ == '__main__':
+    main()
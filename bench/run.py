@@ -0,0 +1,168 @@
+import argparse
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+from bench.mock_pnw import create_mock_app
+
+SCENARIOS = {
+    'dashboard': ('GET', '/dashboard'),
+    'widget-inactive': ('GET', '/api/widgets/inactive-members'),
+    'widget-wars': ('GET', '/api/widgets/wars'),
+    'widget-prices': ('GET', '/api/widgets/prices'),
+    'nations': ('GET', '/nations'),
+    'export-nations': ('GET', '/api/export-nations?format=csv'),
+    'send-resources': ('POST', '/api/send-resources'),
+}
+DEFAULT_SCENARIOS = ['dashboard', 'nations', 'export-nations', 'send-resources']
+
+
+def serve(app, port):
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def seed_user(app, db, User, nation_id, admin_rank):
+    with app.app_context():
+        db.create_all()
+        user = User.query.filter_by(discord_id='bench').first()
+        if user is None:
+            user = User(discord_id='bench', discord_username='bench')
+            db.session.add(user)
+        user.nation_id = nation_id
+        user.nation_name = f'Nation {nation_id}'
+        user.rank = admin_rank
+        user.set_api_key('bench-api-key')
+        db.session.commit()
+        return user.id
+
+
+def run_scenario(base_url, cookies, name, total, concurrency, nations):
+    method, path = SCENARIOS[name]
+    local = threading.local()
+
+    def call(i):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.cookies.update(cookies)
+        
+        body = {'recipient_id': 1 + i % nations, 'food': 1} if method == 'POST' else None
+        started = time.perf_counter()
+        try:
+            response = local.session.request(method, base_url + path, json=body, allow_redirects=False, timeout=120)
+            size = len(response.content)
+            ok = response.status_code < 300 or response.status_code == 304
+        except requests.RequestException:
+            size, ok = 0, False
+        return time.perf_counter() - started, size, ok
+
+    call(0)
+    rss_before = max_rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        samples = list(executor.map(call, range(1, total + 1)))
+    elapsed = time.perf_counter() - started
+    
+    latencies = [latency for latency, _, _ in samples]
+    return {
+        'scenario': name,
+        'requests': total,
+        'concurrency': concurrency,
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'throughput_rps': total / elapsed,
+        'avg_bytes': sum(size for _, size, _ in samples) / total,
+        'peak_rss_mb': max_rss_mb(),
+        'rss_growth_mb': max_rss_mb() - rss_before
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test Lotus against a local P&W stand-in')
+    parser.add_argument('--nations', type=int, default=1000, help='synthetic roster size')
+    parser.add_argument('--wars', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds of latency per upstream call')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(DEFAULT_SCENARIOS),
+                        help=f"comma separated, any of {', '.join(SCENARIOS)} or 'all'")
+    parser.add_argument('--sync-roster', action='store_true', help='sync the roster into the database before measuring')
+    parser.add_argument('--database-url', help='defaults to a throwaway SQLite file')
+    parser.add_argument('--mock-port', type=int, default=5099)
+    parser.add_argument('--app-port', type=int, default=5098)
+    parser.add_argument('--json', help='also write results to this file')
+    args = parser.parse_args()
+    
+    scenarios = list(SCENARIOS) if args.scenarios == 'all' else args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    mock = create_mock_app(args.nations, args.wars, [1], args.latency, args.jitter)
+    serve(mock, args.mock_port)
+    
+    # Config is read at import time, so point the app at the stand-in first.
+    os.environ['PNW_API_URL'] = f'http://127.0.0.1:{args.mock_port}/graphql'
+    os.environ['ALLIANCE_ID'] = '1'
+    os.environ.setdefault('PNW_API_KEY', 'bench')
+    os.environ['DATABASE_URL'] = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    
+    from app import create_app, sync_roster, ADMIN_RANKS
+    from models import db, User
+    
+    app = create_app()
+    
+    user_id = seed_user(app, db, User, 1, ADMIN_RANKS[-1])
+    if args.sync_roster:
+        with app.app_context():
+            print(f"Synced roster: {sync_roster()}")
+    
+    serve(app, args.app_port)
+    cookie = app.session_interface.get_signing_serializer(app).dumps({'user_id': user_id})
+    cookies = {app.config.get('SESSION_COOKIE_NAME', 'session'): cookie}
+    base_url = f'http://127.0.0.1:{args.app_port}'
+    
+    print(f"{args.nations} nations, {args.latency * 1000:.0f}ms upstream latency, "
+          f"{args.requests} requests x {args.concurrency} workers per scenario")
+    print(f"{'scenario':<18}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'req/s':>10}{'errors':>8}{'rss MB':>10}{'+rss MB':>9}")
+    
+    results = []
+    for name in scenarios:
+        upstream_before = mock.config['STATS']['requests']
+        result = run_scenario(base_url, cookies, name, args.requests, args.concurrency, args.nations)
+        result['upstream_calls'] = mock.config['STATS']['requests'] - upstream_before
+        results.append(result)
+        print(f"{name:<18}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}{result['max_ms']:>10.1f}"
+              f"{result['throughput_rps']:>10.1f}{result['errors']:>8}{result['peak_rss_mb']:>10.1f}"
+              f"{result['rss_growth_mb']:>9.1f}")
+    
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
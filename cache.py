@@ -0,0 +1,257 @@
+import enum
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextvars import copy_context
+from datetime import datetime
+from types import SimpleNamespace
+
+from markupsafe import Markup
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def to_json(value):
+    # Cached values are plain data, datetimes, tuples or pnwkit result
+    # objects. Objects come back as namespaces with the same attributes and
+    # enums as their names, which is all the readers rely on.
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [to_json(item) for item in value]}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    if hasattr(value, '__dict__'):
+        return {'__object__': {key: to_json(item) for key, item in vars(value).items()}}
+    return value
+
+
+def from_json(value):
+    if isinstance(value, list):
+        return [from_json(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if '__datetime__' in value:
+        return datetime.fromisoformat(value['__datetime__'])
+    if '__tuple__' in value:
+        return tuple(from_json(item) for item in value['__tuple__'])
+    if '__object__' in value:
+        return SimpleNamespace(**{key: from_json(item) for key, item in value['__object__'].items()})
+    return {key: from_json(item) for key, item in value.items()}
+
+
+class MemoryBackend:
+    # Private to one process, so a delete or set here is invisible to the
+    # other gunicorn workers and to worker.py.
+    shared = False
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def acquire_refresh(self, key, timeout):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def release_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+
+class RedisBackend:
+    # LRU eviction is left to Redis itself (maxmemory-policy allkeys-lru),
+    # every key also carries its hard expiry so stale entries never pile up.
+    shared = True
+
+    def __init__(self, url, prefix='lotus:cache:'):
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return tuple(from_json(json.loads(raw))) if raw is not None else None
+
+    def set(self, key, entry):
+        ttl = max(1, int(entry[2] - time.time()))
+        self.client.set(self.prefix + key, json.dumps(to_json(list(entry))), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def acquire_refresh(self, key, timeout):
+        return bool(self.client.set(f'{self.prefix}lock:{key}', 1, nx=True, ex=timeout))
+
+    def release_refresh(self, key):
+        self.client.delete(f'{self.prefix}lock:{key}')
+
+
+class QueryCache:
+    def __init__(self, backend, stale_ttl=300, refresh_timeout=60, logger=None):
+        self.backend = backend
+        self.stale_ttl = stale_ttl
+        self.refresh_timeout = refresh_timeout
+        self.logger = logger
+        self._loading = {}
+        self._loading_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(name, args):
+        digest = hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f'{name}:{digest}'
+
+    def get_or_set(self, name, args, ttl, loader, serve_stale=True):
+        key = self.make_key(name, args)
+        entry = self.backend.get(key)
+
+        if entry is not None:
+            value, fresh_until, _ = entry
+            if fresh_until > time.time():
+                return value
+            if serve_stale:
+                self._refresh_in_background(key, ttl, loader)
+                return value
+
+        return self._load(key, ttl, loader)
+
+    def _load(self, key, ttl, loader):
+        # Concurrent misses on one key wait for a single loader call instead
+        # of each hitting P&W with the same query.
+        with self._loading_lock:
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                future = self._loading[key] = Future()
+        if not owner:
+            return future.result(timeout=self.refresh_timeout)
+
+        try:
+            value = loader()
+            self.set(key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._loading_lock:
+                del self._loading[key]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self.backend.set(key, (value, now + ttl, now + ttl + self.stale_ttl))
+
+    def invalidate(self, name, args):
+        self.backend.delete(self.make_key(name, args))
+
+    def _refresh_in_background(self, key, ttl, loader):
+        if not self.backend.acquire_refresh(key, self.refresh_timeout):
+            return
+
+        def refresh():
+            try:
+                self.set(key, loader(), ttl)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Cache refresh error for {key}: {e}")
+            finally:
+                self.backend.release_refresh(key)
+
+        # The refresh runs in a copy of the caller's context so loaders can
+        # still reach the app config through current_app.
+        threading.Thread(target=copy_context().run, args=(refresh,), daemon=True).start()
+
+
+class FragmentCache:
+    # Rendered template sections, keyed by role as well as their arguments
+    # because admin markup differs. Each (name, args) pair has a version
+    # token that is part of the key, so invalidating swaps the token and
+    # every role's copy misses at once without knowing which ones exist.
+    #
+    # Tokens are only precise when every process shares them. On a local
+    # backend an invalidation reaches just the process that made it, so
+    # fragments live at most local_ttl there and are never served stale.
+    def __init__(self, cache, version_ttl=30 * 86400, local_ttl=10):
+        self.cache = cache
+        self.version_ttl = version_ttl
+        self.local_ttl = local_ttl
+
+    @property
+    def shared(self):
+        return self.cache.backend.shared
+
+    def _version(self, name, args):
+        key = self.cache.make_key(f'fragment-version:{name}', args)
+        entry = self.cache.backend.get(key)
+        if entry is not None:
+            return entry[0]
+        # A missing token (first use or evicted) starts a new one rather
+        # than reusing an old value that could match a stale fragment.
+        return self.invalidate(name, args)
+
+    def _key_args(self, name, args, role):
+        return [args, role, self._version(name, args)]
+
+    def render(self, name, args, role, ttl, loader):
+        if not self.shared:
+            ttl = min(ttl, self.local_ttl)
+        return Markup(self.cache.get_or_set(f'fragment:{name}', self._key_args(name, args, role), ttl, loader,
+                                            serve_stale=self.shared))
+
+    def peek(self, name, args, role):
+        entry = self.cache.backend.get(self.cache.make_key(f'fragment:{name}', self._key_args(name, args, role)))
+        if entry is None or (not self.shared and entry[1] <= time.time()):
+            return None
+        return Markup(entry[0])
+
+    def invalidate(self, name, args):
+        version = time.time_ns()
+        self.cache.set(self.cache.make_key(f'fragment-version:{name}', args), version, self.version_ttl)
+        return version
+
+
+def create_cache(config, logger=None):
+    if config.get('CACHE_BACKEND') == 'redis':
+        backend = RedisBackend(config['CACHE_REDIS_URL'])
+    else:
+        backend = MemoryBackend(config.get('CACHE_MAX_ENTRIES', 512))
+
+    return QueryCache(backend, stale_ttl=config.get('CACHE_STALE_TTL', 300), logger=logger)
@@ -0,0 +1,58 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class TimeoutSession(requests.Session):
+    # pnwkit does not pass a timeout, so the session supplies one for every
+    # request that does not set its own.
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+def create_session(connect_timeout, read_timeout, retries, backoff, pool_size, retry_methods=None):
+    # Connection failures are always retried since nothing reached the
+    # server. Read errors and 5xx responses are only retried for
+    # retry_methods, which defaults to the idempotent ones.
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=retry_methods or Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    
+    session = TimeoutSession((connect_timeout, read_timeout))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def create_clients(config):
+    common = {
+        'connect_timeout': config['HTTP_CONNECT_TIMEOUT'],
+        'retries': config['HTTP_RETRIES'],
+        'backoff': config['HTTP_RETRY_BACKOFF'],
+        'pool_size': config['HTTP_POOL_SIZE']
+    }
+    return {
+        'discord': create_session(read_timeout=config['DISCORD_READ_TIMEOUT'], **common),
+        # GraphQL reads are POSTs but safe to repeat.
+        'pnw': create_session(read_timeout=config['PNW_READ_TIMEOUT'],
+                              retry_methods=frozenset({'GET', 'POST'}), **common),
+        # Bank mutations must never be replayed after the server may have
+        # seen them; the transfer queue has its own retry with backoff.
+        'pnw_mutations': create_session(read_timeout=config['PNW_READ_TIMEOUT'], **common),
+    }
@@ -7,6 +7,17 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'postgresql://localhost/lotus_db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Per worker process, so Postgres sees at most
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    
+    # Fernet key for stored P&W API keys, derived from SECRET_KEY when unset
+    ENCRYPTION_KEY = os.getenv('ENCRYPTION_KEY')
+    
     SESSION_TYPE = 'filesystem'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
@@ -18,3 +29,92 @@ class Config:
     ALLIANCE_ID = os.getenv('ALLIANCE_ID')
     
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 
+    
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '512'))
+    CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', '300'))
+    
+    # 'memory' only reaches streams in the publishing process, so it is
+    # refused outside debug and testing; deployments need 'redis'.
+    EVENTS_BACKEND = os.getenv('EVENTS_BACKEND', CACHE_BACKEND)
+    EVENTS_REDIS_URL = os.getenv('EVENTS_REDIS_URL', CACHE_REDIS_URL)
+    EVENTS_HISTORY = int(os.getenv('EVENTS_HISTORY', '200'))
+    EVENTS_KEEPALIVE = int(os.getenv('EVENTS_KEEPALIVE', '15'))
+    EVENTS_MAX_STREAM_SECONDS = int(os.getenv('EVENTS_MAX_STREAM_SECONDS', '300'))
+    
+    PRICES_CACHE_TTL = int(os.getenv('PRICES_CACHE_TTL', '60'))
+    ROSTER_CACHE_TTL = int(os.getenv('ROSTER_CACHE_TTL', '300'))
+    WARS_CACHE_TTL = int(os.getenv('WARS_CACHE_TTL', '120'))
+    FRAGMENT_CACHE_TTL = int(os.getenv('FRAGMENT_CACHE_TTL', '3600'))
+    # Cap on rendered fragments with CACHE_BACKEND=memory, where edits and
+    # syncs only invalidate the copies of the process that made them.
+    FRAGMENT_LOCAL_TTL = int(os.getenv('FRAGMENT_LOCAL_TTL', '10'))
+    
+    ROSTER_SYNC_INTERVAL = int(os.getenv('ROSTER_SYNC_INTERVAL', '300'))
+    RANK_SYNC_INTERVAL = int(os.getenv('RANK_SYNC_INTERVAL', '300'))
+    RANK_SYNC_BATCH = int(os.getenv('RANK_SYNC_BATCH', '500'))
+    PRICE_COLLECT_INTERVAL = int(os.getenv('PRICE_COLLECT_INTERVAL', '60'))
+    PRICE_RAW_RETENTION_DAYS = int(os.getenv('PRICE_RAW_RETENTION_DAYS', '7'))
+    
+    INACTIVITY_DEFAULT_DAYS = int(os.getenv('INACTIVITY_DEFAULT_DAYS', '3'))
+    # Per alliance position overrides, e.g. "APPLICANT:7,OFFICER:2"
+    INACTIVITY_RANK_DAYS = {
+        item.split(':')[0].strip().upper(): int(item.split(':')[1])
+        for item in os.getenv('INACTIVITY_RANK_DAYS', 'APPLICANT:7').split(',') if item.strip()
+    }
+    INACTIVITY_BUCKETS = [int(i) for i in os.getenv('INACTIVITY_BUCKETS', '0,1,3,7,14,30').split(',')]
+    INACTIVITY_HISTORY_DAYS = int(os.getenv('INACTIVITY_HISTORY_DAYS', '365'))
+    
+    WAR_SYNC_INTERVAL = int(os.getenv('WAR_SYNC_INTERVAL', '120'))
+    WAR_BACKFILL_DAYS = int(os.getenv('WAR_BACKFILL_DAYS', '14'))
+    WAR_REFRESH_BATCH = int(os.getenv('WAR_REFRESH_BATCH', '500'))
+    WAR_REFRESH_AGE = int(os.getenv('WAR_REFRESH_AGE', '600'))
+    WAR_PAGE_SIZE = int(os.getenv('WAR_PAGE_SIZE', '50'))
+    NATION_PAGE_SIZE = int(os.getenv('NATION_PAGE_SIZE', '100'))
+    
+    ACTIVITY_LOG_RETENTION_MONTHS = int(os.getenv('ACTIVITY_LOG_RETENTION_MONTHS', '12'))
+    ACTIVITY_LOG_PRUNE_INTERVAL = int(os.getenv('ACTIVITY_LOG_PRUNE_INTERVAL', '86400'))
+    ACTIVITY_LOG_PRUNE_BATCH = int(os.getenv('ACTIVITY_LOG_PRUNE_BATCH', '5000'))
+    ACTIVITY_LOG_PAGE_SIZE = int(os.getenv('ACTIVITY_LOG_PAGE_SIZE', '50'))
+    
+    TRANSFER_POLL_INTERVAL = int(os.getenv('TRANSFER_POLL_INTERVAL', '5'))
+    TRANSFER_BATCH_SIZE = int(os.getenv('TRANSFER_BATCH_SIZE', '50'))
+    TRANSFER_MAX_RECIPIENTS = int(os.getenv('TRANSFER_MAX_RECIPIENTS', '500'))
+    TRANSFER_RATE = float(os.getenv('TRANSFER_RATE', '1'))
+    TRANSFER_BURST = int(os.getenv('TRANSFER_BURST', '5'))
+    TRANSFER_MAX_ATTEMPTS = int(os.getenv('TRANSFER_MAX_ATTEMPTS', '5'))
+    TRANSFER_BACKOFF_BASE = int(os.getenv('TRANSFER_BACKOFF_BASE', '30'))
+    TRANSFER_BACKOFF_MAX = int(os.getenv('TRANSFER_BACKOFF_MAX', '1800'))
+    TRANSFER_STALE_SECONDS = int(os.getenv('TRANSFER_STALE_SECONDS', '600'))
+    
+    HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+    HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+    HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.3'))
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+    DISCORD_READ_TIMEOUT = float(os.getenv('DISCORD_READ_TIMEOUT', '10'))
+    PNW_READ_TIMEOUT = float(os.getenv('PNW_READ_TIMEOUT', '30'))
+    
+    ALLIANCE_IDS = [int(i) for i in os.getenv('ALLIANCE_IDS', os.getenv('ALLIANCE_ID', '0')).split(',') if i.strip()]
+    
+    PNW_API_URL = os.getenv('PNW_API_URL')
+    PNW_RATE_LIMIT = float(os.getenv('PNW_RATE_LIMIT', '5'))
+    PNW_MAX_WORKERS = int(os.getenv('PNW_MAX_WORKERS', '4'))
+    
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SAMPLE_INTERVAL = float(os.getenv('PROFILING_SAMPLE_INTERVAL', '0.005'))
+    SLOW_REQUEST_THRESHOLD_MS = float(os.getenv('SLOW_REQUEST_THRESHOLD_MS', '1000'))
+    SLOW_REQUEST_RETENTION_DAYS = int(os.getenv('SLOW_REQUEST_RETENTION_DAYS', '14'))
+    SLOW_REQUEST_PRUNE_INTERVAL = int(os.getenv('SLOW_REQUEST_PRUNE_INTERVAL', '86400'))
+    
+    DASHBOARD_WORKERS = int(os.getenv('DASHBOARD_WORKERS', '8'))
+    DASHBOARD_TIMEOUTS = {
+        'inactive_members': float(os.getenv('DASHBOARD_INACTIVE_TIMEOUT', '3')),
+        'alliance_wars': float(os.getenv('DASHBOARD_WARS_TIMEOUT', '3')),
+        'resource_prices': float(os.getenv('DASHBOARD_PRICES_TIMEOUT', '3')),
+        'nations': float(os.getenv('DASHBOARD_NATIONS_TIMEOUT', '10')),
+        'military_analytics': float(os.getenv('DASHBOARD_ANALYTICS_TIMEOUT', '5'))
+    }
+
@@ -0,0 +1,71 @@
+import threading
+import time
+from concurrent.futures import CancelledError, TimeoutError
+from contextvars import copy_context
+
+from instrumentation import source
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _run_in_app_context(app, name, fn):
+    with app.app_context(), source(name):
+        return fn()
+
+
+def _forget(key, future):
+    with _inflight_lock:
+        if _inflight.get(key) is future:
+            del _inflight[key]
+
+
+def _submit(app, executor, key, name, fn):
+    # A section that missed its deadline is left running so its result
+    # still lands in the query cache. Retries of the same view wait on that
+    # run instead of queueing another copy behind it on the shared pool.
+    with _inflight_lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = executor.submit(copy_context().run, _run_in_app_context, app, name, fn)
+        _inflight[key] = future
+    future.add_done_callback(lambda done: _forget(key, done))
+    return future
+
+
+def gather_sources(app, executor, sources, key=()):
+    # sources maps a section name to (callable, timeout in seconds). key
+    # identifies everything else the callables depend on (URL, role...), so
+    # only identical requests share a run.
+    started = time.monotonic()
+    futures = {
+        name: (_submit(app, executor, (key, name), name, fn), timeout)
+        for name, (fn, timeout) in sources.items()
+    }
+
+    results = {}
+    unavailable = set()
+
+    for name, (future, timeout) in futures.items():
+        try:
+            results[name] = future.result(timeout=max(0, started + timeout - time.monotonic()))
+        except TimeoutError:
+            # Still queued means the pool is saturated, give the slot back
+            # rather than start work nobody is waiting for.
+            if future.cancel():
+                app.logger.warning(f"Dashboard section {name} timed out after {timeout}s before it started")
+            else:
+                app.logger.warning(f"Dashboard section {name} timed out after {timeout}s")
+            results[name] = None
+            unavailable.add(name)
+        except CancelledError:
+            # Another request gave up on the run this one joined.
+            results[name] = None
+            unavailable.add(name)
+        except Exception as e:
+            app.logger.error(f"Dashboard section {name} failed: {e}")
+            results[name] = None
+            unavailable.add(name)
+
+    return results, unavailable
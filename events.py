@@ -0,0 +1,193 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class Subscriber:
+    def __init__(self, queue_size):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lagged = False
+
+
+class EventHub:
+    # Fans events out to the SSE streams of this process. Recent events are
+    # kept so a reconnecting client can replay from its Last-Event-ID.
+    def __init__(self, history=200, queue_size=100):
+        self.queue_size = queue_size
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def dispatch(self, event):
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        
+        for subscriber in subscribers:
+            try:
+                subscriber.queue.put_nowait(event)
+            except queue.Full:
+                # A client this far behind is dropped and replays from
+                # history when it reconnects.
+                subscriber.lagged = True
+
+    def subscribe(self, last_event_id=None):
+        subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            backlog = [event for event in self._history if last_event_id and event['id'] > last_event_id]
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+class MemoryBroker:
+    available = True
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def publish(self, event):
+        self.hub.dispatch(event)
+
+    def start(self):
+        pass
+
+
+class DisabledBroker:
+    # Stands in for the memory broker outside debug and testing. With several
+    # gunicorn workers plus worker.py, an event published in one process
+    # would never reach streams held by another, so it fails loudly instead.
+    available = False
+
+    def publish(self, event):
+        raise RuntimeError('live updates need EVENTS_BACKEND=redis')
+
+    def start(self):
+        pass
+
+
+class RedisBroker:
+    # Every process publishes to one channel and runs a listener thread that
+    # feeds its own hub, so a change made in any gunicorn worker (or the
+    # background worker) reaches clients connected to all of them.
+    available = True
+
+    def __init__(self, hub, url, channel='lotus:events', logger=None):
+        if redis is None:
+            raise RuntimeError('EVENTS_BACKEND=redis requires the redis package')
+        self.hub = hub
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+        self.logger = logger
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def publish(self, event):
+        self.client.publish(self.channel, json.dumps(event))
+
+    def start(self):
+        # Started lazily by the first stream so forked workers each get
+        # their own listener and processes that only publish never do.
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, daemon=True, name='events-listener')
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    self.hub.dispatch(json.loads(message['data']))
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Event listener error: {e}")
+                time.sleep(1)
+
+
+class Events:
+    def __init__(self, hub, broker, keepalive=15, max_stream_seconds=300, logger=None):
+        self.hub = hub
+        self.broker = broker
+        self.keepalive = keepalive
+        self.max_stream_seconds = max_stream_seconds
+        self.logger = logger
+
+    @property
+    def available(self):
+        return self.broker.available
+
+    def publish(self, event_type, data, alliance_id=None):
+        event = {'id': f'{time.time_ns():020d}', 'type': event_type, 'data': data, 'alliance_id': alliance_id}
+        try:
+            self.broker.publish(event)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Error publishing {event_type} event: {e}")
+
+    def stream(self, alliance_id, last_event_id=None):
+        # Streams end after max_stream_seconds so worker threads are
+        # recycled; EventSource reconnects with Last-Event-ID and the hub
+        # replays anything missed in between.
+        self.broker.start()
+        subscriber, backlog = self.hub.subscribe(last_event_id)
+
+        def visible(event):
+            return event['alliance_id'] is None or event['alliance_id'] == alliance_id
+
+        def generate():
+            try:
+                yield 'retry: 5000\n\n'
+                for event in backlog:
+                    if visible(event):
+                        yield format_event(event)
+                
+                deadline = time.monotonic() + self.max_stream_seconds
+                while time.monotonic() < deadline and not subscriber.lagged:
+                    try:
+                        event = subscriber.queue.get(timeout=self.keepalive)
+                    except queue.Empty:
+                        yield ': keepalive\n\n'
+                        continue
+                    if visible(event):
+                        yield format_event(event)
+            finally:
+                self.hub.unsubscribe(subscriber)
+
+        return generate()
+
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def create_events(config, logger=None):
+    hub = EventHub(config.get('EVENTS_HISTORY', 200))
+    if config.get('EVENTS_BACKEND') == 'redis':
+        broker = RedisBroker(hub, config['EVENTS_REDIS_URL'], logger=logger)
+    elif config.get('DEBUG') or config.get('TESTING'):
+        broker = MemoryBroker(hub)
+    else:
+        if logger:
+            logger.error('Live updates are off: the memory event broker only works in a single '
+                         'process, set EVENTS_BACKEND=redis')
+        broker = DisabledBroker()
+    
+    return Events(hub, broker, keepalive=config.get('EVENTS_KEEPALIVE', 15),
+                  max_stream_seconds=config.get('EVENTS_MAX_STREAM_SECONDS', 300), logger=logger)
@@ -0,0 +1,120 @@
+import csv
+import json
+import zlib
+from itertools import islice
+
+from flask import Response, stream_with_context
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+class _ChunkSink:
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_csv(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([label for label, _ in columns]).encode('utf-8')
+    for row in rows:
+        yield writer.writerow(row).encode('utf-8')
+
+
+def iter_ndjson(columns, rows):
+    keys = [key for _, key in columns]
+    for row in rows:
+        yield (json.dumps(dict(zip(keys, row)), default=str) + '\n').encode('utf-8')
+
+
+def iter_parquet(columns, rows, batch_size=1000):
+    keys = [key for _, key in columns]
+    sink = _ChunkSink()
+    writer = None
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        table = pa.Table.from_pylist([dict(zip(keys, row)) for row in batch],
+                                     schema=writer.schema if writer else None)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield from sink.drain()
+
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.schema([(key, pa.string()) for key in keys]))
+    writer.close()
+    yield from sink.drain()
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def validate_format(fmt):
+    if fmt not in FORMATS:
+        return f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}"
+    if fmt == 'parquet' and pa is None:
+        return 'Parquet export requires pyarrow to be installed'
+    return None
+
+
+def export_response(name, columns, rows, fmt='csv', compress=False):
+    if fmt == 'csv':
+        chunks = iter_csv(columns, rows)
+    elif fmt == 'ndjson':
+        chunks = iter_ndjson(columns, rows)
+    else:
+        chunks = iter_parquet(columns, rows)
+
+    filename = f'{name}.{fmt}'
+    mimetype = FORMATS[fmt]
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
@@ -0,0 +1,26 @@
+from bisect import bisect_right
+from datetime import timedelta
+
+
+def threshold_for(rank, config):
+    return config['INACTIVITY_RANK_DAYS'].get((rank or '').upper(), config['INACTIVITY_DEFAULT_DAYS'])
+
+
+def bucket_for(days, buckets):
+    # Buckets are the lower bounds of each range, so with [0, 1, 3, 7] a
+    # member 5 days inactive lands in bucket 3.
+    index = bisect_right(buckets, days) - 1
+    return buckets[max(index, 0)]
+
+
+def classify(last_active, rank, now, config, vacation=False):
+    if last_active is None:
+        return None, None, False, None
+    
+    # Nations in vacation mode told the game they are away, so they keep
+    # their bucket for the history but are never flagged.
+    days = max(0, (now - last_active).days)
+    threshold = threshold_for(rank, config)
+    inactive = days >= threshold and not vacation
+    inactive_since = last_active + timedelta(days=threshold) if inactive else None
+    return days, bucket_for(days, config['INACTIVITY_BUCKETS']), inactive, inactive_since
@@ -0,0 +1,194 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import has_request_context, request
+
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+current_source = ContextVar('current_source', default=None)
+
+# Callables invoked with the duration of every upstream call, used by the
+# request profiler to attribute P&W time to the request that caused it.
+observers = []
+
+
+@contextmanager
+def source(name):
+    token = current_source.set(name)
+    try:
+        yield
+    finally:
+        current_source.reset(token)
+
+
+def source_label():
+    name = current_source.get()
+    if name:
+        return name
+    if has_request_context():
+        return request.endpoint or 'unknown'
+    return 'background'
+
+
+class Sample:
+    size = 0
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self.quota = {}
+
+    def record(self, operation, field, source, duration, size=0, error=False):
+        key = (operation, field, source)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'count': 0, 'errors': 0, 'sum': 0.0, 'max': 0.0,
+                    'items': 0, 'buckets': [0] * len(BUCKETS)
+                }
+            series['count'] += 1
+            series['sum'] += duration
+            series['max'] = max(series['max'], duration)
+            series['items'] += size
+            if error:
+                series['errors'] += 1
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    series['buckets'][i] += 1
+
+    def record_quota(self, rate_limit):
+        if rate_limit is None or rate_limit.limit is None or rate_limit.remaining is None:
+            return
+        with self._lock:
+            self.quota = {
+                'limit': rate_limit.limit,
+                'remaining': rate_limit.remaining,
+                'reset': rate_limit.reset,
+                'updated_at': time.time()
+            }
+
+    def snapshot(self):
+        with self._lock:
+            series = [
+                {'operation': operation, 'field': field, 'source': source, **{
+                    key: list(value) if isinstance(value, list) else value for key, value in data.items()
+                }}
+                for (operation, field, source), data in self._series.items()
+            ]
+            quota = dict(self.quota)
+
+        for item in series:
+            item['avg'] = item['sum'] / item['count'] if item['count'] else 0
+            item['p50'] = quantile(item, 0.5)
+            item['p95'] = quantile(item, 0.95)
+        return sorted(series, key=lambda item: item['sum'], reverse=True), quota
+
+    def render_prometheus(self):
+        series, quota = self.snapshot()
+        lines = [
+            '# HELP lotus_pnw_request_duration_seconds Latency of P&W API calls',
+            '# TYPE lotus_pnw_request_duration_seconds histogram'
+        ]
+        for item in series:
+            labels = f'operation="{item["operation"]}",field="{item["field"]}",source="{item["source"]}"'
+            for bound, count in zip(BUCKETS, item['buckets']):
+                lines.append(f'lotus_pnw_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'lotus_pnw_request_duration_seconds_bucket{{{labels},le="+Inf"}} {item["count"]}')
+            lines.append(f'lotus_pnw_request_duration_seconds_sum{{{labels}}} {item["sum"]:.6f}')
+            lines.append(f'lotus_pnw_request_duration_seconds_count{{{labels}}} {item["count"]}')
+
+        lines += ['# HELP lotus_pnw_request_errors_total Failed P&W API calls',
+                  '# TYPE lotus_pnw_request_errors_total counter']
+        for item in series:
+            lines.append(f'lotus_pnw_request_errors_total{{operation="{item["operation"]}",field="{item["field"]}",'
+                         f'source="{item["source"]}"}} {item["errors"]}')
+
+        lines += ['# HELP lotus_pnw_result_items_total Items returned by P&W API calls',
+                  '# TYPE lotus_pnw_result_items_total counter']
+        for item in series:
+            lines.append(f'lotus_pnw_result_items_total{{operation="{item["operation"]}",field="{item["field"]}",'
+                         f'source="{item["source"]}"}} {item["items"]}')
+
+        if quota:
+            lines += ['# HELP lotus_pnw_ratelimit_remaining Remaining P&W API requests in the current window',
+                      '# TYPE lotus_pnw_ratelimit_remaining gauge',
+                      f'lotus_pnw_ratelimit_remaining {quota["remaining"]}',
+                      '# TYPE lotus_pnw_ratelimit_limit gauge',
+                      f'lotus_pnw_ratelimit_limit {quota["limit"]}',
+                      '# TYPE lotus_pnw_ratelimit_reset_timestamp gauge',
+                      f'lotus_pnw_ratelimit_reset_timestamp {quota["reset"]}']
+
+        return '\n'.join(lines) + '\n'
+
+
+def quantile(item, q):
+    if not item['count']:
+        return None
+    target = q * item['count']
+    for bound, count in zip(BUCKETS, item['buckets']):
+        if count >= target:
+            return bound
+    return item['max']
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def observe(operation, field, kit=None):
+    sample = Sample()
+    started = time.perf_counter()
+    try:
+        yield sample
+    except Exception:
+        metrics.record(operation, field, source_label(), time.perf_counter() - started, error=True)
+        raise
+    else:
+        metrics.record(operation, field, source_label(), time.perf_counter() - started, sample.size)
+    finally:
+        metrics.record_quota(getattr(kit, 'rate_limit', None))
+        for observer in observers:
+            observer(time.perf_counter() - started)
+
+
+def _result_size(result, field):
+    value = getattr(result, field, None)
+    if isinstance(value, list):
+        return len(value)
+    return 1 if value is not None else 0
+
+
+class InstrumentedQuery:
+    def __init__(self, query, operation, field, kit):
+        self._query = query
+        self._operation = operation
+        self._field = field
+        self._kit = kit
+
+    def get(self, *args, **kwargs):
+        with observe(self._operation, self._field, self._kit) as sample:
+            result = self._query.get(*args, **kwargs)
+            sample.size = _result_size(result, self._field)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._query, name)
+
+
+class InstrumentedKit:
+    def __init__(self, kit):
+        self._kit = kit
+
+    def query(self, field, *args, **kwargs):
+        return InstrumentedQuery(self._kit.query(field, *args, **kwargs), 'query', field, self._kit)
+
+    def mutation(self, field, *args, **kwargs):
+        return InstrumentedQuery(self._kit.mutation(field, *args, **kwargs), 'mutation', field, self._kit)
+
+    def __getattr__(self, name):
+        return getattr(self._kit, name)
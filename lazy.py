@@ -0,0 +1,47 @@
+import os
+import threading
+import weakref
+
+_instances = weakref.WeakSet()
+
+
+class Lazy:
+    # Builds the wrapped client on first use instead of at import, so a
+    # worker boots without touching the network. Anything built before a
+    # fork is dropped in the child and rebuilt there on demand, which keeps
+    # sockets, connection pools and executor threads out of shared state.
+    # Its own methods are underscored so they never shadow the wrapped
+    # object's, e.g. KitCache.get.
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+        _instances.add(self)
+
+    def _resolve(self):
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self._factory()
+                value = self._value
+        return value
+
+    def reset(self):
+        self._value = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+
+def _reset_after_fork():
+    for instance in list(_instances):
+        instance.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,10 +1,26 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import lru_cache
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from cryptography.fernet import Fernet
 import os
 import base64
+import hashlib
+import json
+import math
 
 db = SQLAlchemy()
 
+@lru_cache(maxsize=4)
+def _fernet(key):
+    return Fernet(key)
+
+def get_cipher():
+    key = current_app.config.get('ENCRYPTION_KEY')
+    if not key:
+        key = base64.urlsafe_b64encode(hashlib.sha256(current_app.config['SECRET_KEY'].encode()).digest())
+    return _fernet(key)
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -13,7 +29,9 @@ class User(db.Model):
     discord_username = db.Column(db.String(100), nullable=False)
     nation_id = db.Column(db.Integer, unique=True, nullable=True, index=True)
     nation_name = db.Column(db.String(100), nullable=True)
+    alliance_id = db.Column(db.Integer, nullable=True, index=True)
     rank = db.Column(db.String(50), nullable=True)
+    encrypted_api_key = db.Column(db.LargeBinary, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -22,7 +40,7 @@ class User(db.Model):
     
     def set_api_key(self, api_key):
         if api_key:
-            encrypted = cipher_suite.encrypt(api_key.encode())
+            encrypted = get_cipher().encrypt(api_key.encode())
             self.encrypted_api_key = encrypted
         else:
             self.encrypted_api_key = None
@@ -30,7 +48,7 @@ class User(db.Model):
     def get_api_key(self):
         if self.encrypted_api_key:
             try:
-                decrypted = cipher_suite.decrypt(self.encrypted_api_key)
+                decrypted = get_cipher().decrypt(self.encrypted_api_key)
                 return decrypted.decode()
             except Exception as e:
                 print(f"Error decrypting API key for user {self.id}: {e}")
@@ -44,6 +62,7 @@ class User(db.Model):
             'discord_username': self.discord_username,
             'nation_id': self.nation_id,
             'nation_name': self.nation_name,
+            'alliance_id': self.alliance_id,
             'rank': self.rank,
             'has_api_key': self.encrypted_api_key is not None,
             'created_at': self.created_at.isoformat() if self.created_at else None
@@ -74,12 +93,16 @@ class Announcement(db.Model):
 
 class ActivityLog(db.Model):
     __tablename__ = 'activity_logs'
+    __table_args__ = (
+        db.Index('ix_activity_logs_created_at_id', 'created_at', 'id'),
+        db.Index('ix_activity_logs_user_created_at_id', 'user_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     action = db.Column(db.String(200), nullable=False)
     details = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     user = db.relationship('User', backref=db.backref('activity_logs', lazy=True))
     
@@ -94,3 +117,335 @@ class ActivityLog(db.Model):
             'details': self.details,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
+
+class Nation(db.Model):
+    __tablename__ = 'nations'
+    __table_args__ = (
+        db.Index('ix_nations_alliance_last_active', 'alliance_id', 'last_active'),
+        db.Index('ix_nations_alliance_inactive', 'alliance_id', 'is_inactive', 'inactive_days'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    alliance_id = db.Column(db.Integer, nullable=False, index=True)
+    nation_name = db.Column(db.String(100), nullable=False)
+    alliance_position = db.Column(db.String(50), nullable=True)
+    num_cities = db.Column(db.Integer, default=0)
+    beige_turns = db.Column(db.Integer, default=0)
+    projects = db.Column(db.Integer, default=0)
+    soldiers = db.Column(db.Integer, default=0)
+    tanks = db.Column(db.Integer, default=0)
+    aircraft = db.Column(db.Integer, default=0)
+    ships = db.Column(db.Integer, default=0)
+    missiles = db.Column(db.Integer, default=0)
+    nukes = db.Column(db.Integer, default=0)
+    color = db.Column(db.String(20), nullable=True)
+    last_active = db.Column(db.DateTime, nullable=True, index=True)
+    inactive_days = db.Column(db.Integer, nullable=True)
+    inactivity_bucket = db.Column(db.Integer, nullable=True)
+    is_inactive = db.Column(db.Boolean, nullable=True)
+    inactive_since = db.Column(db.DateTime, nullable=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<Nation {self.nation_name}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'alliance_id': self.alliance_id,
+            'nation_name': self.nation_name,
+            'alliance_position': self.alliance_position,
+            'num_cities': self.num_cities,
+            'beige_turns': self.beige_turns,
+            'projects': self.projects,
+            'soldiers': self.soldiers,
+            'tanks': self.tanks,
+            'aircraft': self.aircraft,
+            'ships': self.ships,
+            'missiles': self.missiles,
+            'nukes': self.nukes,
+            'color': self.color,
+            'last_active': self.last_active.isoformat() if self.last_active else None,
+            'inactive_days': self.inactive_days,
+            'is_inactive': self.is_inactive,
+            'synced_at': self.synced_at.isoformat() if self.synced_at else None
+        }
+
+class PriceSnapshot(db.Model):
+    __tablename__ = 'price_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    recorded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    food = db.Column(db.Float)
+    coal = db.Column(db.Float)
+    oil = db.Column(db.Float)
+    uranium = db.Column(db.Float)
+    lead = db.Column(db.Float)
+    iron = db.Column(db.Float)
+    bauxite = db.Column(db.Float)
+    gasoline = db.Column(db.Float)
+    munitions = db.Column(db.Float)
+    steel = db.Column(db.Float)
+    aluminum = db.Column(db.Float)
+    
+    def __repr__(self):
+        return f'<PriceSnapshot {self.recorded_at}>'
+
+class PriceRollup(db.Model):
+    __tablename__ = 'price_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'resource', 'bucket_start', name='uq_price_rollups_bucket'),
+    )
+    
+    RESOLUTIONS = ('minute', 'hour', 'day')
+    
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.String(10), nullable=False)
+    resource = db.Column(db.String(20), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    min_price = db.Column(db.Float, nullable=False)
+    max_price = db.Column(db.Float, nullable=False)
+    sum_price = db.Column(db.Float, nullable=False)
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PriceRollup {self.resource} {self.resolution} {self.bucket_start}>'
+    
+    @staticmethod
+    def bucket_for(timestamp, resolution):
+        if resolution == 'minute':
+            return timestamp.replace(second=0, microsecond=0)
+        if resolution == 'hour':
+            return timestamp.replace(minute=0, second=0, microsecond=0)
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    def add_sample(self, price):
+        if not self.samples:
+            self.min_price = self.max_price = price
+            self.sum_price = 0
+            self.samples = 0
+        self.min_price = min(self.min_price, price)
+        self.max_price = max(self.max_price, price)
+        self.sum_price += price
+        self.samples += 1
+    
+    @property
+    def avg_price(self):
+        return self.sum_price / self.samples if self.samples else None
+    
+    def to_dict(self):
+        return {
+            'bucket': self.bucket_start.isoformat(),
+            'min': self.min_price,
+            'max': self.max_price,
+            'avg': self.avg_price,
+            'samples': self.samples
+        }
+
+class BankTransfer(db.Model):
+    __tablename__ = 'bank_transfers'
+    __table_args__ = (
+        db.Index('ix_bank_transfers_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.String(32), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    recipient_id = db.Column(db.Integer, nullable=False)
+    resources = db.Column(db.Text, nullable=False)
+    note = db.Column(db.String(200), nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    user = db.relationship('User', backref=db.backref('bank_transfers', lazy=True))
+    
+    def __repr__(self):
+        return f'<BankTransfer {self.id} to {self.recipient_id} ({self.status})>'
+    
+    def get_resources(self):
+        return json.loads(self.resources)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'batch_id': self.batch_id,
+            'recipient_id': self.recipient_id,
+            'resources': self.get_resources(),
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+class SlowRequest(db.Model):
+    __tablename__ = 'slow_requests'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    route = db.Column(db.String(100), nullable=False, index=True)
+    method = db.Column(db.String(10), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    total_ms = db.Column(db.Float, nullable=False)
+    db_ms = db.Column(db.Float, nullable=False, default=0)
+    db_queries = db.Column(db.Integer, nullable=False, default=0)
+    upstream_ms = db.Column(db.Float, nullable=False, default=0)
+    upstream_calls = db.Column(db.Integer, nullable=False, default=0)
+    template_ms = db.Column(db.Float, nullable=False, default=0)
+    profile = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<SlowRequest {self.method} {self.route} {self.total_ms:.0f}ms>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'path': self.path,
+            'status_code': self.status_code,
+            'user_id': self.user_id,
+            'total_ms': self.total_ms,
+            'db_ms': self.db_ms,
+            'db_queries': self.db_queries,
+            'upstream_ms': self.upstream_ms,
+            'upstream_calls': self.upstream_calls,
+            'template_ms': self.template_ms,
+            'has_profile': self.profile is not None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+class War(db.Model):
+    __tablename__ = 'wars'
+    __table_args__ = (
+        db.Index('ix_wars_att_alliance_date', 'att_alliance_id', 'date'),
+        db.Index('ix_wars_def_alliance_date', 'def_alliance_id', 'date'),
+    )
+    
+    TURN_LENGTH = timedelta(hours=2)
+    
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    date = db.Column(db.DateTime, nullable=False, index=True)
+    end_date = db.Column(db.DateTime, nullable=True)
+    ends_at = db.Column(db.DateTime, nullable=False, index=True)
+    reason = db.Column(db.String(200), nullable=True)
+    war_type = db.Column(db.String(20), nullable=True)
+    att_id = db.Column(db.Integer, nullable=False, index=True)
+    def_id = db.Column(db.Integer, nullable=False, index=True)
+    att_alliance_id = db.Column(db.Integer, nullable=True)
+    def_alliance_id = db.Column(db.Integer, nullable=True)
+    att_name = db.Column(db.String(100), nullable=True)
+    def_name = db.Column(db.String(100), nullable=True)
+    turns_left = db.Column(db.Integer, nullable=False, default=0)
+    att_points = db.Column(db.Integer, default=0)
+    def_points = db.Column(db.Integer, default=0)
+    att_resistance = db.Column(db.Integer, default=100)
+    def_resistance = db.Column(db.Integer, default=100)
+    winner_id = db.Column(db.Integer, nullable=True)
+    synced_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<War {self.id} {self.att_name} vs {self.def_name}>'
+    
+    @classmethod
+    def next_turn(cls, timestamp):
+        # Turns change on every even UTC hour.
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        return hour + timedelta(hours=2 - hour.hour % 2)
+    
+    def set_turns_left(self, turns_left, synced_at):
+        self.turns_left = turns_left
+        self.synced_at = synced_at
+        if turns_left > 0:
+            self.ends_at = self.next_turn(synced_at) + (turns_left - 1) * self.TURN_LENGTH
+        else:
+            self.ends_at = synced_at
+    
+    def is_active(self, now=None):
+        return self.end_date is None and self.ends_at > (now or datetime.utcnow())
+    
+    def turns_remaining(self, now=None):
+        now = now or datetime.utcnow()
+        if not self.is_active(now):
+            return 0
+        return math.ceil((self.ends_at - now) / self.TURN_LENGTH)
+    
+    def to_dict(self, now=None):
+        now = now or datetime.utcnow()
+        return {
+            'id': self.id,
+            'date': self.date.isoformat(),
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'ends_at': self.ends_at.isoformat(),
+            'active': self.is_active(now),
+            'turns_left': self.turns_remaining(now),
+            'reason': self.reason,
+            'war_type': self.war_type,
+            'att_id': self.att_id,
+            'def_id': self.def_id,
+            'att_alliance_id': self.att_alliance_id,
+            'def_alliance_id': self.def_alliance_id,
+            'attacker': self.att_name or 'Unknown',
+            'defender': self.def_name or 'Unknown',
+            'att_points': self.att_points,
+            'def_points': self.def_points,
+            'att_resistance': self.att_resistance,
+            'def_resistance': self.def_resistance,
+            'winner_id': self.winner_id
+        }
+
+class InactivityChange(db.Model):
+    __tablename__ = 'inactivity_changes'
+    __table_args__ = (
+        db.Index('ix_inactivity_changes_alliance_changed_at', 'alliance_id', 'changed_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    nation_id = db.Column(db.Integer, nullable=False, index=True)
+    alliance_id = db.Column(db.Integer, nullable=False)
+    nation_name = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    inactive_days = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<InactivityChange {self.nation_name} {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'nation_id': self.nation_id,
+            'nation_name': self.nation_name,
+            'status': self.status,
+            'inactive_days': self.inactive_days,
+            'changed_at': self.changed_at.isoformat()
+        }
+
+class InactivityDaily(db.Model):
+    __tablename__ = 'inactivity_daily'
+    __table_args__ = (
+        db.UniqueConstraint('alliance_id', 'day', 'bucket', name='uq_inactivity_daily_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    alliance_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    bucket = db.Column(db.Integer, nullable=False)
+    members = db.Column(db.Integer, nullable=False, default=0)
+    inactive = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<InactivityDaily {self.alliance_id} {self.day} {self.bucket}+>'
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'bucket': self.bucket,
+            'members': self.members,
+            'inactive': self.inactive
+        }
@@ -0,0 +1,85 @@
+import base64
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from itertools import islice
+
+from instrumentation import observe
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def iter_pages(kit, field, arguments, fields, per_page=250, max_workers=4, limiter=None):
+    # The first page goes through pnwkit's Paginator, which tells us lastPage.
+    # The rest are plain queries with an explicit page argument, fetched with
+    # a bounded window in flight and yielded in page order.
+    def fetch(page):
+        if limiter:
+            limiter.wait()
+        with observe('query', field, kit) as sample:
+            data = getattr(kit.query(field, {**arguments, "first": per_page, "page": page}, fields).get(), field)
+            sample.size = len(data)
+        return data
+
+    paginator = kit.query(field, {**arguments, "first": per_page}, fields).paginate(field)
+    if limiter:
+        limiter.wait()
+    with observe('query', field, kit) as sample:
+        paginator.fill()
+        sample.size = paginator.paginator_info.count
+    yield from islice(paginator, paginator.paginator_info.count)
+
+    last_page = paginator.paginator_info.lastPage
+    if last_page <= 1:
+        return
+
+    workers = max(1, min(max_workers, last_page - 1))
+    pages = iter(range(2, last_page + 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each page runs in a copy of the caller's context so instrumentation
+        # and profiling still attribute it to the originating request.
+        def submit(page):
+            return executor.submit(copy_context().run, fetch, page)
+
+        pending = deque(submit(page) for page in islice(pages, workers * 2))
+        try:
+            while pending:
+                data = pending.popleft().result()
+                pending.extend(submit(page) for page in islice(pages, 1))
+                yield from data
+        finally:
+            # A caller that stops early shouldn't wait on pages it won't read.
+            for future in pending:
+                future.cancel()
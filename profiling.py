@@ -0,0 +1,195 @@
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from flask import g, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import instrumentation
+
+current_profile = ContextVar('current_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.upstream_time = 0.0
+        self.upstream_calls = 0
+        self.template_time = 0.0
+        self.template_starts = []
+        self._lock = threading.Lock()
+
+    def add_query(self, duration):
+        with self._lock:
+            self.db_time += duration
+            self.db_queries += 1
+
+    def add_upstream(self, duration):
+        with self._lock:
+            self.upstream_time += duration
+            self.upstream_calls += 1
+
+    def add_template(self, duration):
+        with self._lock:
+            self.template_time += duration
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+class StackSampler:
+    # Polls the request thread's stack from a side thread, so the request
+    # itself runs unmodified and the overhead is one frame walk per interval.
+    def __init__(self, thread_id, interval=0.005, max_depth=40):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, limit=30):
+        lines = [f'{self.samples} samples every {self.interval * 1000:.0f}ms']
+        for stack, count in self.stacks.most_common(limit):
+            frames = stack.split(';')
+            lines.append(f'\n{count} samples ({count / max(self.samples, 1):.0%})')
+            lines.extend(f'  {frame}' for frame in frames[-12:])
+        return '\n'.join(lines)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_start'].pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_query(time.perf_counter() - started)
+
+
+def _before_render(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.template_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    profile = current_profile.get()
+    if profile is not None and profile.template_starts:
+        profile.add_template(time.perf_counter() - profile.template_starts.pop())
+
+
+def _on_upstream(duration):
+    profile = current_profile.get()
+    if profile is not None:
+        profile.add_upstream(duration)
+
+
+def init_profiling(app, db, model, is_admin):
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    # The engine and upstream hooks are process wide, so a second app from
+    # create_app must not register them again.
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    if _on_upstream not in instrumentation.observers:
+        instrumentation.observers.append(_on_upstream)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_profile():
+        profile = RequestProfile()
+        g.profile = profile
+        g.profile_token = current_profile.set(profile)
+
+        if request.args.get('_profile') == '1' and is_admin():
+            g.sampler = StackSampler(threading.get_ident(), app.config['PROFILING_SAMPLE_INTERVAL'])
+            g.sampler.start()
+
+    @app.after_request
+    def finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+
+        sampler = g.pop('sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+        # Exports and the event stream return before their body is generated,
+        # so anything measured here would only cover the setup.
+        if response.is_streamed:
+            return response
+
+        total = profile.total_time
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;desc="{profile.db_queries} queries";dur={profile.db_time * 1000:.1f}',
+            f'upstream;desc="{profile.upstream_calls} calls";dur={profile.upstream_time * 1000:.1f}',
+            f'tpl;dur={profile.template_time * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}'
+        ])
+
+        if sampler is not None or total * 1000 >= app.config['SLOW_REQUEST_THRESHOLD_MS']:
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(model.__table__.insert().values(
+                        route=request.endpoint or request.path,
+                        method=request.method,
+                        path=request.full_path[:500],
+                        status_code=response.status_code,
+                        user_id=g.current_user.id if g.get('current_user') else None,
+                        total_ms=total * 1000,
+                        db_ms=profile.db_time * 1000,
+                        db_queries=profile.db_queries,
+                        upstream_ms=profile.upstream_time * 1000,
+                        upstream_calls=profile.upstream_calls,
+                        template_ms=profile.template_time * 1000,
+                        profile=sampler.report() if sampler is not None else None
+                    ))
+                if sampler is not None:
+                    response.headers['X-Profile-Id'] = str(result.inserted_primary_key[0])
+            except Exception as e:
+                app.logger.error(f"Error saving slow request log: {e}")
+
+        return response
+
+    @app.teardown_request
+    def reset_profile(exc):
+        sampler = g.pop('sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+        token = g.pop('profile_token', None)
+        if token is not None:
+            current_profile.reset(token)
@@ -0,0 +1,177 @@
+from datetime import datetime
+
+from pagination import encode_cursor, decode_cursor
+
+FIELDS = ('id', 'nation_name', 'alliance_position', 'num_cities', 'beige_turns', 'projects', 'soldiers',
+          'tanks', 'aircraft', 'ships', 'missiles', 'nukes', 'color', 'last_active')
+
+DEFAULT_FIELDS = tuple(field for field in FIELDS if field != 'projects')
+
+SORTABLE = ('nation_name', 'alliance_position', 'num_cities', 'beige_turns', 'projects', 'soldiers',
+            'tanks', 'aircraft', 'ships', 'missiles', 'nukes', 'color', 'last_active')
+
+TEXT_FIELDS = ('nation_name', 'alliance_position', 'color')
+
+MILITARY = ('soldiers', 'tanks', 'aircraft', 'ships', 'missiles', 'nukes')
+
+# Missing values sort as these in both the SQL and in-memory paths, so a
+# cursor taken from one page keeps working if the roster sync lands
+# between two requests.
+EPOCH = datetime(1970, 1, 1)
+
+
+def _null_value(field):
+    return '' if field in TEXT_FIELDS or field == 'last_active' else 0
+
+
+def _split(value):
+    return [item.strip() for item in (value or '').split(',') if item.strip()]
+
+
+class NationQuery:
+    def __init__(self, fields, sort, filters, limit, after=None):
+        self.fields = fields
+        self.sort = sort
+        self.filters = filters
+        self.limit = limit
+        self.after = after
+
+    @classmethod
+    def from_args(cls, args, default_limit, max_limit):
+        fields = _split(args.get('fields')) or list(DEFAULT_FIELDS)
+        unknown = [field for field in fields if field not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+
+        sort = []
+        for item in _split(args.get('sort')) or ['nation_name']:
+            field = item.lstrip('-')
+            if field not in SORTABLE:
+                raise ValueError(f'Cannot sort by {field}')
+            sort.append((field, item.startswith('-')))
+        sort.append(('id', False))
+
+        filters = {}
+        for name in ('min_cities', 'max_cities') + tuple(f'min_{unit}' for unit in MILITARY):
+            if args.get(name) not in (None, ''):
+                filters[name] = int(args.get(name))
+        if args.get('beige') not in (None, ''):
+            if args.get('beige') not in ('0', '1'):
+                raise ValueError('beige must be 0 or 1')
+            filters['beige'] = args.get('beige') == '1'
+        if _split(args.get('color')):
+            filters['color'] = [color.lower() for color in _split(args.get('color'))]
+        if _split(args.get('rank')):
+            filters['rank'] = [rank.upper() for rank in _split(args.get('rank'))]
+
+        limit = min(max(int(args.get('limit', default_limit)), 1), max_limit)
+
+        query = cls(fields, sort, filters, limit)
+        if args.get('cursor'):
+            query.after = query.decode(args.get('cursor'))
+        return query
+
+    @property
+    def sort_key(self):
+        return ','.join(('-' if desc else '') + field for field, desc in self.sort)
+
+    def decode(self, cursor):
+        # The sort spec travels in the cursor so a page can't be continued
+        # under a different ordering.
+        values = decode_cursor(cursor)
+        if len(values) != len(self.sort) + 1 or values[0] != self.sort_key:
+            raise ValueError('Cursor does not match sort')
+        return values[1:]
+
+    def cursor_for(self, row):
+        return encode_cursor(self.sort_key, *(self._value(row, field) for field, _ in self.sort))
+
+    def _value(self, row, field):
+        value = row.get(field)
+        return _null_value(field) if value is None else value
+
+    # In-memory path, for the cached P&W roster before the first sync
+
+    def _matches(self, row):
+        filters = self.filters
+        cities = row.get('num_cities') or 0
+        if 'min_cities' in filters and cities < filters['min_cities']:
+            return False
+        if 'max_cities' in filters and cities > filters['max_cities']:
+            return False
+        for unit in MILITARY:
+            if f'min_{unit}' in filters and (row.get(unit) or 0) < filters[f'min_{unit}']:
+                return False
+        if 'beige' in filters and ((row.get('beige_turns') or 0) > 0) != filters['beige']:
+            return False
+        if 'color' in filters and (row.get('color') or '').lower() not in filters['color']:
+            return False
+        if 'rank' in filters and (row.get('alliance_position') or '').upper() not in filters['rank']:
+            return False
+        return True
+
+    def _is_after(self, row):
+        for (field, desc), cursor in zip(self.sort, self.after):
+            value = self._value(row, field)
+            if value != cursor:
+                return value < cursor if desc else value > cursor
+        return False
+
+    def apply_rows(self, rows):
+        rows = [row for row in rows if self._matches(row)]
+        total = len(rows) if self.after is None else None
+        for field, desc in reversed(self.sort):
+            rows.sort(key=lambda row: self._value(row, field), reverse=desc)
+        if self.after is not None:
+            rows = [row for row in rows if self._is_after(row)]
+        return self.page(rows[:self.limit + 1]), total
+
+    # SQL path, for the synced nations table
+
+    def _column(self, model, db, field):
+        column = getattr(model, field)
+        if field == 'last_active':
+            return db.func.coalesce(column, EPOCH)
+        return db.func.coalesce(column, _null_value(field))
+
+    def _sql_value(self, field, value):
+        if field == 'last_active':
+            return datetime.fromisoformat(value) if value else EPOCH
+        return value
+
+    def filter_sql(self, query, model, db):
+        filters = self.filters
+        if 'min_cities' in filters:
+            query = query.filter(model.num_cities >= filters['min_cities'])
+        if 'max_cities' in filters:
+            query = query.filter(model.num_cities <= filters['max_cities'])
+        for unit in MILITARY:
+            if f'min_{unit}' in filters:
+                query = query.filter(getattr(model, unit) >= filters[f'min_{unit}'])
+        if 'beige' in filters:
+            query = query.filter(model.beige_turns > 0 if filters['beige'] else db.func.coalesce(model.beige_turns, 0) == 0)
+        if 'color' in filters:
+            query = query.filter(db.func.lower(model.color).in_(filters['color']))
+        if 'rank' in filters:
+            query = query.filter(db.func.upper(model.alliance_position).in_(filters['rank']))
+        return query
+
+    def apply_sql(self, query, model, db):
+        columns = [self._column(model, db, field) for field, _ in self.sort]
+        if self.after is not None:
+            # Keyset condition for a mixed-direction sort: the row beats the
+            # cursor on the first column that differs.
+            clauses = []
+            for i, ((field, desc), value) in enumerate(zip(self.sort, self.after)):
+                value = self._sql_value(field, value)
+                equal = [columns[j] == self._sql_value(self.sort[j][0], self.after[j]) for j in range(i)]
+                clauses.append(db.and_(*equal, columns[i] < value if desc else columns[i] > value))
+            query = query.filter(db.or_(*clauses))
+        order = [column.desc() if desc else column.asc() for column, (_, desc) in zip(columns, self.sort)]
+        return query.order_by(*order).limit(self.limit + 1)
+
+    def page(self, rows):
+        next_cursor = self.cursor_for(rows[self.limit - 1]) if len(rows) > self.limit else None
+        return [{field: row.get(field) for field in self.fields} for row in rows[:self.limit]], next_cursor
@@ -0,0 +1,61 @@
+import logging
+import os
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+# Config is read at import time, so the coalition has to be set first.
+os.environ.setdefault('ALLIANCE_ID', '1')
+
+import app as lotus
+from bench.mock_pnw import create_mock_app
+from config import Config
+from models import db
+
+
+@pytest.fixture
+def universe():
+    # Overridden by tests that need a different mock P&W world.
+    return {'nations': 10, 'wars': 0}
+
+
+@pytest.fixture
+def mock_pnw(universe):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    mock = create_mock_app(**universe)
+    server = make_server('127.0.0.1', 0, mock, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield mock, f'http://127.0.0.1:{server.server_port}/graphql'
+    server.shutdown()
+
+
+@pytest.fixture
+def config():
+    # Overridden by tests that need settings read when the app is built.
+    return {}
+
+
+@pytest.fixture
+def app(mock_pnw, tmp_path, config):
+    _, url = mock_pnw
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path}/lotus.db'
+        PNW_API_URL = url
+        TRANSFER_RATE = 1000
+        HTTP_RETRIES = 0
+
+    for key, value in config.items():
+        setattr(TestConfig, key, value)
+
+    # Clients are module level and keep whatever config built them first.
+    for client in (lotus.http_clients, lotus.kit, lotus.cache, lotus.fragments, lotus.pnw_limiter,
+                   lotus.user_kits, lotus.transfer_bucket):
+        client.reset()
+
+    app = lotus.create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,53 @@
+import analytics
+
+
+def row(num_cities=10, beige_turns=0, soldiers=0, tanks=0, aircraft=0, ships=0, missiles=0, nukes=0, color='red'):
+    return (num_cities, beige_turns, soldiers, tanks, aircraft, ships, missiles, nukes, color)
+
+
+def summarize(rows):
+    return analytics.summarize(analytics.load_columns(rows))
+
+
+def test_empty_roster():
+    assert summarize([]) == {'nations': 0}
+
+
+def test_single_nation():
+    summary = summarize([row(num_cities=10, soldiers=150000, tanks=12500, aircraft=750, ships=150,
+                             missiles=3, nukes=1, beige_turns=5, color='blue')])
+
+    assert summary['nations'] == 1 and summary['cities'] == 10
+    assert summary['readiness'] == {'mean': 100.0, 'p10': 100.0, 'p25': 100.0, 'p50': 100.0, 'p75': 100.0, 'p90': 100.0}
+    assert summary['militarization'] == {'soldiers': 100.0, 'tanks': 100.0, 'aircraft': 100.0, 'ships': 100.0}
+    assert summary['totals'] == {'soldiers': 150000, 'tanks': 12500, 'aircraft': 750, 'ships': 150,
+                                 'missiles': 3, 'nukes': 1}
+    assert [band['cities'] for band in summary['city_bands']] == ['10-14']
+    assert summary['colors'] == {'blue': 1}
+    assert summary['beige'] == {'nations': 1, 'share': 100.0,
+                                'turns': {'p10': 5.0, 'p25': 5.0, 'p50': 5.0, 'p75': 5.0, 'p90': 5.0}}
+
+
+def test_units_over_capacity_are_capped():
+    summary = summarize([row(num_cities=1, soldiers=10 ** 6, aircraft=10 ** 6)])
+
+    assert summary['militarization']['soldiers'] == 100.0
+    assert summary['readiness']['mean'] == 60.0
+
+
+def test_zero_or_missing_cities():
+    summary = summarize([row(num_cities=0, soldiers=30000), row(num_cities=None, color=None), row(num_cities=12)])
+
+    assert summary['nations'] == 3 and summary['cities'] == 12
+    # Capacity is counted as one city, so the numbers stay finite.
+    assert summary['militarization']['soldiers'] == round(100 / 3, 2)
+    assert sum(band['nations'] for band in summary['city_bands']) == 3
+    assert summary['city_bands'][0] == {**summary['city_bands'][0], 'cities': '1-9', 'nations': 2}
+    assert summary['colors'] == {'red': 2, 'unknown': 1}
+
+
+def test_no_beige_nations():
+    summary = summarize([row(), row(num_cities=25)])
+
+    assert summary['beige'] == {'nations': 0, 'share': 0.0, 'turns': None}
+    assert [band['cities'] for band in summary['city_bands']] == ['10-14', '25-29']
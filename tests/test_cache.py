@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+import pnwkit.data
+import pytest
+
+import cache as cache_module
+from cache import MemoryBackend, QueryCache, to_json, from_json
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, 'time', clock)
+    return clock
+
+
+def counting_loader(value='value'):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return f'{value} {len(calls)}'
+    return loader, calls
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_fresh_entry_is_served_without_loading(clock):
+    cache = QueryCache(MemoryBackend(), stale_ttl=30)
+    loader, calls = counting_loader()
+
+    assert cache.get_or_set('prices', [], 10, loader) == 'value 1'
+    clock.now += 9.9
+    assert cache.get_or_set('prices', [], 10, loader) == 'value 1'
+    assert len(calls) == 1
+
+
+def test_stale_entry_is_served_while_refreshing(clock):
+    cache = QueryCache(MemoryBackend(), stale_ttl=30)
+    loader, calls = counting_loader()
+    cache.get_or_set('prices', [], 10, loader)
+
+    clock.now += 11
+    assert cache.get_or_set('prices', [], 10, loader) == 'value 1'
+    assert wait_for(lambda: cache.get_or_set('prices', [], 10, loader) == 'value 2')
+    assert len(calls) == 2
+
+
+def test_stale_entry_is_not_served_when_disabled(clock):
+    cache = QueryCache(MemoryBackend(), stale_ttl=30)
+    loader, calls = counting_loader()
+    cache.get_or_set('fragment', [], 10, loader, serve_stale=False)
+
+    clock.now += 11
+    assert cache.get_or_set('fragment', [], 10, loader, serve_stale=False) == 'value 2'
+
+
+def test_entry_expires_after_stale_ttl(clock):
+    cache = QueryCache(MemoryBackend(), stale_ttl=30)
+    loader, calls = counting_loader()
+    cache.get_or_set('prices', [], 10, loader)
+
+    clock.now += 40
+    assert cache.backend.get(cache.make_key('prices', [])) is None
+    assert cache.get_or_set('prices', [], 10, loader) == 'value 2'
+    assert len(calls) == 2
+
+
+def test_concurrent_misses_share_one_load():
+    cache = QueryCache(MemoryBackend())
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        started.set()
+        release.wait(2)
+        return 'roster'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_set('roster', [1], 60, loader)))
+               for _ in range(5)]
+    threads[0].start()
+    started.wait(2)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['roster'] * 5
+    assert len(calls) == 1
+
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    cache = QueryCache(MemoryBackend())
+
+    def loader():
+        raise RuntimeError('P&W is down')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_set('roster', [1], 60, loader)
+    assert cache.get_or_set('roster', [1], 60, lambda: 'recovered') == 'recovered'
+
+
+def test_json_round_trip_keeps_what_readers_use():
+    nation = pnwkit.data.Nation.from_data({
+        'id': '7', 'nation_name': 'Lotus', 'alliance_position': 'OFFICER', 'num_cities': 12,
+        'last_active': '2024-05-01T12:00:00+00:00'
+    })
+    recorded_at = datetime(2024, 5, 1, 12, 30)
+    entry = ([nation], (2.5, recorded_at), {'name': 'x', 'days': [1, 2]})
+
+    restored = from_json(json.loads(json.dumps(to_json(entry))))
+
+    assert restored[1] == (2.5, recorded_at)
+    assert restored[2] == {'name': 'x', 'days': [1, 2]}
+    assert (restored[0][0].id, restored[0][0].nation_name, restored[0][0].alliance_position) == (7, 'Lotus', 'OFFICER')
+    assert restored[0][0].last_active == nation.last_active
@@ -0,0 +1,54 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from dashboard import gather_sources
+
+
+def test_timed_out_section_is_joined_not_rerun():
+    app = Flask(__name__)
+    app.logger.setLevel(logging.ERROR)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'done'
+
+    with ThreadPoolExecutor(2) as executor:
+        for _ in range(3):
+            results, unavailable = gather_sources(app, executor, {'wars': (slow, 0.05)}, key='page')
+            assert unavailable == {'wars'} and results['wars'] is None
+        release.set()
+        results, unavailable = gather_sources(app, executor, {'wars': (slow, 1)}, key='page')
+
+    assert results == {'wars': 'done'} and not unavailable
+    assert len(calls) == 1
+
+
+def test_queued_section_is_cancelled_on_timeout():
+    app = Flask(__name__)
+    app.logger.setLevel(logging.ERROR)
+    release = threading.Event()
+    calls = []
+
+    with ThreadPoolExecutor(1) as executor:
+        gather_sources(app, executor, {'busy': (lambda: release.wait(5), 0)}, key='a')
+        _, unavailable = gather_sources(app, executor, {'queued': (lambda: calls.append(1), 0.05)}, key='b')
+        release.set()
+
+    assert unavailable == {'queued'}
+    assert calls == []
+
+
+def test_different_keys_run_separately():
+    app = Flask(__name__)
+
+    with ThreadPoolExecutor(2) as executor:
+        first, _ = gather_sources(app, executor, {'nations': (lambda: 1, 1)}, key='alliance-1')
+        second, _ = gather_sources(app, executor, {'nations': (lambda: 2, 1)}, key='alliance-2')
+
+    assert (first['nations'], second['nations']) == (1, 2)
@@ -0,0 +1,113 @@
+import pytest
+
+import app as lotus
+import cache as cache_module
+from cache import FragmentCache, MemoryBackend, QueryCache
+from models import db, User, Announcement
+
+
+class SharedBackend(MemoryBackend):
+    # Stands in for Redis, every process would see the same tokens.
+    shared = True
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now[0])
+    return now
+
+
+def counting_loader():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return f'<p>render {len(calls)}</p>'
+    return loader, calls
+
+
+def test_local_fragments_live_at_most_local_ttl(clock):
+    fragments = FragmentCache(QueryCache(MemoryBackend(), stale_ttl=300), local_ttl=10)
+    loader, calls = counting_loader()
+
+    fragments.render('announcements', [], 'member', 3600, loader)
+    clock[0] += 9
+    assert fragments.render('announcements', [], 'member', 3600, loader) == '<p>render 1</p>'
+    assert fragments.peek('announcements', [], 'member') == '<p>render 1</p>'
+
+    clock[0] += 2
+    assert fragments.peek('announcements', [], 'member') is None
+    assert fragments.render('announcements', [], 'member', 3600, loader) == '<p>render 2</p>'
+
+
+def test_shared_fragments_keep_their_ttl(clock):
+    fragments = FragmentCache(QueryCache(SharedBackend(), stale_ttl=300), local_ttl=10)
+    loader, calls = counting_loader()
+
+    fragments.render('announcements', [], 'member', 3600, loader)
+    clock[0] += 3599
+    assert fragments.render('announcements', [], 'member', 3600, loader) == '<p>render 1</p>'
+    assert len(calls) == 1
+
+
+def test_invalidate_misses_every_role_at_once(clock):
+    fragments = FragmentCache(QueryCache(SharedBackend()), local_ttl=10)
+    loader, calls = counting_loader()
+    for role in ('admin', 'member'):
+        fragments.render('alliance_wars', [1], role, 60, loader)
+    fragments.render('alliance_wars', [2], 'member', 60, loader)
+
+    clock[0] += 1
+    fragments.invalidate('alliance_wars', [1])
+
+    assert fragments.peek('alliance_wars', [1], 'admin') is None
+    assert fragments.peek('alliance_wars', [1], 'member') is None
+    assert fragments.peek('alliance_wars', [2], 'member') == '<p>render 3</p>'
+
+
+def version(name, args):
+    return lotus.fragments._version(name, args)
+
+
+def admin_client(app):
+    user = User(discord_id='1', discord_username='shogun', nation_id=1, alliance_id=1, rank='Shogun')
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+    return client
+
+
+def test_announcement_writes_bump_the_token(app):
+    client = admin_client(app)
+    token = version('announcements', [])
+    lotus.render_announcements('member')
+
+    client.post('/api/announcement', json={'title': 'War drills', 'content': 'Saturday'})
+    assert version('announcements', []) != token
+    assert 'War drills' in lotus.render_announcements('member')
+
+    announcement_id = Announcement.query.one().id
+    for method, body in (('put', {'title': 'Drills moved'}), ('delete', None)):
+        token = version('announcements', [])
+        getattr(client, method)(f'/api/announcement/{announcement_id}', json=body)
+        assert version('announcements', []) != token
+    assert 'Drills moved' not in lotus.render_announcements('member')
+
+
+@pytest.fixture
+def universe():
+    return {'nations': 10, 'wars': 30}
+
+
+def test_war_sync_bumps_the_token(app):
+    token = version('alliance_wars', [1])
+    lotus.render_alliance_wars(1, 'member')
+    assert lotus.fragments.peek('alliance_wars', [1], 'member') is not None
+
+    lotus.sync_wars()
+
+    assert version('alliance_wars', [1]) != token
+    assert lotus.fragments.peek('alliance_wars', [1], 'member') is None
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as lotus
+from inactivity import bucket_for, classify, threshold_for
+from models import db, Nation
+
+CONFIG = {
+    'INACTIVITY_DEFAULT_DAYS': 3,
+    'INACTIVITY_RANK_DAYS': {'APPLICANT': 7},
+    'INACTIVITY_BUCKETS': [0, 1, 3, 7, 14, 30],
+}
+
+NOW = datetime(2024, 5, 10, 12)
+
+
+@pytest.mark.parametrize('rank, days', [
+    ('APPLICANT', 7), ('applicant', 7), ('MEMBER', 3), ('Shogun', 3), (None, 3), ('', 3),
+])
+def test_threshold_for(rank, days):
+    assert threshold_for(rank, CONFIG) == days
+
+
+@pytest.mark.parametrize('days, bucket', [
+    (0, 0), (1, 1), (2, 1), (3, 3), (6, 3), (7, 7), (13, 7), (14, 14), (29, 14), (30, 30), (400, 30), (-1, 0),
+])
+def test_bucket_for_uses_lower_bounds(days, bucket):
+    assert bucket_for(days, CONFIG['INACTIVITY_BUCKETS']) == bucket
+
+
+@pytest.mark.parametrize('ago, inactive', [
+    (timedelta(days=3) - timedelta(seconds=1), False),
+    (timedelta(days=3), True),
+    (timedelta(days=3, hours=23), True),
+])
+def test_member_becomes_inactive_on_the_threshold_day(ago, inactive):
+    days, bucket, is_inactive, since = classify(NOW - ago, 'MEMBER', NOW, CONFIG)
+
+    assert is_inactive is inactive
+    assert since == (NOW - ago + timedelta(days=3) if inactive else None)
+    assert bucket == bucket_for(days, CONFIG['INACTIVITY_BUCKETS'])
+
+
+def test_applicants_get_the_longer_threshold():
+    last_active = NOW - timedelta(days=6, hours=23)
+
+    assert classify(last_active, 'APPLICANT', NOW, CONFIG)[2] is False
+    assert classify(last_active, 'MEMBER', NOW, CONFIG)[2] is True
+
+
+def test_never_seen_nation_is_not_classified():
+    assert classify(None, 'MEMBER', NOW, CONFIG) == (None, None, False, None)
+
+
+def test_activity_after_now_counts_as_today():
+    assert classify(NOW + timedelta(minutes=5), 'MEMBER', NOW, CONFIG) == (0, 0, False, None)
+
+
+def test_vacation_mode_keeps_the_bucket_but_is_never_inactive():
+    last_active = NOW - timedelta(days=20)
+
+    assert classify(last_active, 'MEMBER', NOW, CONFIG, vacation=True) == (20, 14, False, None)
+    assert classify(last_active, 'MEMBER', NOW, CONFIG)[2] is True
+
+
+def test_roster_sync_flags_beige_nations_but_not_vacation_mode(app, mock_pnw, monkeypatch):
+    mock, _ = mock_pnw
+    universe = mock.config['UNIVERSE']
+    original = universe.nation
+    overrides = {
+        1: {'beige_turns': 12, 'last_active': (universe.now - timedelta(days=5)).isoformat()},
+        2: {'vacation_mode_turns': 40, 'last_active': (universe.now - timedelta(days=20)).isoformat()},
+    }
+    monkeypatch.setattr(universe, 'nation', lambda nation_id: {
+        **original(nation_id), 'alliance_position': 'MEMBER', **overrides.get(nation_id, {})
+    })
+
+    lotus.sync_roster()
+
+    beige, vacation = db.session.get(Nation, 1), db.session.get(Nation, 2)
+    assert (beige.inactive_days, beige.inactivity_bucket, beige.is_inactive) == (5, 3, True)
+    assert (vacation.inactive_days, vacation.inactivity_bucket, vacation.is_inactive) == (20, 14, False)
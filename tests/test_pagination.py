@@ -0,0 +1,16 @@
+import app as lotus
+from pagination import iter_pages
+
+
+def test_iter_pages_yields_every_page_in_order(app):
+    nations = list(iter_pages(lotus.kit, "nations", {"alliance_id": lotus.ALLIANCE_IDS}, "id",
+                              per_page=3, max_workers=2))
+
+    assert [int(nation.id) for nation in nations] == sorted(int(nation.id) for nation in nations)
+    assert len(nations) == len({nation.id for nation in nations}) > 3
+
+
+def test_iter_pages_single_page(app):
+    nations = list(iter_pages(lotus.kit, "nations", {"id": [1, 2]}, "id", per_page=50))
+
+    assert [int(nation.id) for nation in nations] == [1, 2]
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as lotus
+from models import db, User, SlowRequest
+
+
+@pytest.fixture
+def config():
+    return {'PROFILING_ENABLED': True, 'SLOW_REQUEST_THRESHOLD_MS': 0}
+
+
+def test_streamed_responses_are_not_logged(app):
+    user = User(discord_id='1', discord_username='member', nation_id=1, alliance_id=1)
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+
+    export = client.get('/api/export-prices?resolution=hour')
+    history = client.get('/api/prices/history?resource=food&resolution=hour')
+
+    assert 'Server-Timing' not in export.headers and 'Server-Timing' in history.headers
+    assert [row.route for row in SlowRequest.query.all()] == ['main.price_history']
+
+
+def test_prune_slow_requests_drops_rows_past_retention(app):
+    now = datetime.utcnow()
+    for age in (1, 13, 15, 30):
+        db.session.add(SlowRequest(route='main.dashboard', method='GET', path='/dashboard?', total_ms=1500,
+                                   created_at=now - timedelta(days=age)))
+    db.session.commit()
+
+    assert lotus.prune_slow_requests() == 2
+    assert sorted((now - row.created_at).days for row in SlowRequest.query.all()) == [1, 13]
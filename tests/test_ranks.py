@@ -0,0 +1,72 @@
+import app as lotus
+from bench.mock_pnw import POSITION_NAMES
+from models import db, User
+
+
+def nation_with_position(mock, position):
+    universe = mock.config['UNIVERSE']
+    return next(nation_id for nation_id in range(1, universe.nations + 1)
+                if universe.nation(nation_id)['alliance_position'] == position)
+
+
+def login(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+def test_admin_keeps_access_after_rank_sync(app, mock_pnw):
+    mock, _ = mock_pnw
+    nation_id = nation_with_position(mock, 'LEADER')
+    user = User(discord_id='1', discord_username='shogun', nation_id=nation_id, alliance_id=1, rank='Shogun')
+    db.session.add(user)
+    db.session.commit()
+
+    lotus.sync_ranks()
+
+    db.session.expire_all()
+    assert db.session.get(User, user.id).rank == POSITION_NAMES['LEADER'] == 'Shogun'
+    assert login(app, user.id).get('/admin/metrics').status_code == 200
+
+
+def test_rank_sync_demotes_to_the_custom_position_name(app, mock_pnw):
+    mock, _ = mock_pnw
+    nation_id = nation_with_position(mock, 'MEMBER')
+    user = User(discord_id='1', discord_username='former', nation_id=nation_id, alliance_id=1, rank='Shogun')
+    db.session.add(user)
+    db.session.commit()
+
+    assert lotus.sync_ranks() == 1
+
+    db.session.expire_all()
+    assert db.session.get(User, user.id).rank == 'Samurai'
+    assert login(app, user.id).get('/admin/metrics').status_code == 302
+
+
+def test_deleted_nation_is_unlinked(app):
+    user = User(discord_id='1', discord_username='gone', nation_id=999, alliance_id=1, rank='Shogun')
+    db.session.add(user)
+    db.session.commit()
+
+    lotus.sync_ranks()
+
+    db.session.expire_all()
+    user = db.session.get(User, user.id)
+    assert (user.nation_id, user.alliance_id, user.rank) == (None, None, None)
+    assert login(app, user.id).get('/dashboard').headers['Location'].endswith('/profile')
+
+
+def test_linking_a_nation_stores_its_position_name(app, mock_pnw):
+    mock, _ = mock_pnw
+    nation_id = nation_with_position(mock, 'HEIR')
+    user = User(discord_id='1', discord_username='heir')
+    db.session.add(user)
+    db.session.commit()
+
+    response = login(app, user.id).post('/profile', data={'nation_name': f'Nation {nation_id}'})
+
+    assert response.status_code == 302
+    db.session.expire_all()
+    user = db.session.get(User, user.id)
+    assert (user.nation_id, user.rank) == (nation_id, 'Daimyo')
@@ -0,0 +1,111 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app as lotus
+from models import db, Nation
+from pagination import encode_cursor, decode_cursor
+from roster_query import NationQuery, FIELDS
+
+
+def make_rows(count=23):
+    # Few distinct values, so most sort columns tie and the id tiebreak
+    # decides the order. The columns the nations table leaves nullable are
+    # missing on purpose.
+    rng = random.Random(7)
+    start = datetime(2024, 5, 1, 12)
+    return [{
+        'id': nation_id,
+        'nation_name': f'Nation {rng.randint(1, 5)}',
+        'alliance_position': rng.choice(['MEMBER', 'OFFICER', None]),
+        'num_cities': rng.choice([10, 10, 15, 20]),
+        'beige_turns': rng.choice([0, 0, 3]),
+        'projects': rng.randint(0, 3),
+        'soldiers': rng.choice([0, 50000, 50000]),
+        'tanks': rng.randint(0, 2) * 1000,
+        'aircraft': 0,
+        'ships': rng.choice([0, 0, 10]),
+        'missiles': 0,
+        'nukes': 0,
+        'color': rng.choice(['red', 'Blue', None]),
+        'last_active': rng.choice([None, (start - timedelta(days=rng.randint(0, 3))).isoformat()]),
+    } for nation_id in range(1, count + 1)]
+
+
+def query_for(**args):
+    return NationQuery.from_args(MultiDict({'fields': ','.join(FIELDS), **args}), 50, 500)
+
+
+def all_pages(fetch, **args):
+    pages = []
+    cursor = None
+    while True:
+        query = query_for(**args, **({'cursor': cursor} if cursor else {}))
+        (rows, cursor), total = fetch(query)
+        pages.append((rows, cursor, total))
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    moment = datetime(2024, 5, 1, 12, 30)
+    cursor = encode_cursor('-num_cities,id', 12, 'Nation 1', moment)
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ['-num_cities,id', 12, 'Nation 1', str(moment)]
+
+    query = query_for(sort='-num_cities')
+    assert query.decode(query.cursor_for({'id': 4, 'num_cities': None})) == [0, 4]
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', encode_cursor('nation_name,id', 'a', 1)[:-2], 'eyJhIjogMX0'])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        query_for(cursor=cursor)
+
+
+def test_cursor_does_not_carry_over_to_another_sort():
+    cursor = query_for(sort='num_cities').cursor_for({'id': 1, 'num_cities': 10})
+
+    with pytest.raises(ValueError, match='does not match sort'):
+        query_for(sort='-num_cities', cursor=cursor)
+
+
+@pytest.mark.parametrize('sort', ['-num_cities', 'nation_name,-soldiers', 'color,-last_active', 'beige_turns'])
+def test_keyset_pages_cover_ties_exactly_once(sort):
+    rows = make_rows()
+    # Upstream rows can also miss the counters, which sort as zero.
+    rows[3]['num_cities'] = rows[8]['beige_turns'] = None
+
+    pages = all_pages(lambda query: query.apply_rows(rows), sort=sort, limit='4')
+
+    seen = [row['id'] for page, _, _ in pages for row in page]
+    query = query_for(sort=sort)
+    expected = rows[:]
+    for field, desc in reversed(query.sort):
+        expected.sort(key=lambda row: query._value(row, field), reverse=desc)
+    assert seen == [row['id'] for row in expected]
+    assert pages[0][2] == len(rows) and all(total is None for _, _, total in pages[1:])
+
+
+@pytest.mark.parametrize('args', [
+    {'sort': '-num_cities', 'limit': '4'},
+    {'sort': 'nation_name,-soldiers', 'limit': '5'},
+    {'sort': '-last_active,color', 'limit': '3'},
+    {'sort': 'alliance_position,-beige_turns', 'limit': '6', 'beige': '0'},
+    {'sort': '-ships', 'limit': '2', 'min_cities': '15', 'color': 'red,blue'},
+])
+def test_sql_and_in_memory_paths_return_the_same_pages(app, args):
+    rows = make_rows()
+    for row in rows:
+        last_active = datetime.fromisoformat(row['last_active']) if row['last_active'] else None
+        db.session.add(Nation(alliance_id=1, **{**row, 'last_active': last_active}))
+    db.session.commit()
+
+    in_memory = all_pages(lambda query: query.apply_rows(rows), **args)
+    sql = all_pages(lambda query: lotus.get_nations_page(1, query), **args)
+
+    assert sql == in_memory
+    assert len(in_memory) > 1
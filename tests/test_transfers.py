@@ -0,0 +1,70 @@
+import json
+
+import app as lotus
+from models import db, User, BankTransfer
+
+
+def queue_transfers(count, api_key='test-api-key'):
+    user = User(discord_id='1', discord_username='tester', nation_id=1, rank='Shogun')
+    user.set_api_key(api_key)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add_all([
+        BankTransfer(batch_id='batch', user_id=user.id, recipient_id=recipient_id,
+                     resources=json.dumps({'food': 10.0}), note='Sent via Lotus')
+        for recipient_id in range(2, 2 + count)
+    ])
+    db.session.commit()
+
+
+def test_process_transfers_sends_queued_deposits(app, mock_pnw):
+    mock, _ = mock_pnw
+    queue_transfers(3)
+
+    assert lotus.process_transfers() == 3
+
+    transfers = BankTransfer.query.order_by(BankTransfer.id).all()
+    assert [transfer.status for transfer in transfers] == ['sent'] * 3
+    assert all(transfer.attempts == 1 and transfer.last_error is None for transfer in transfers)
+    assert sorted(deposit['receiver'] for deposit in mock.config['DEPOSITS']) == [2, 3, 4]
+    assert lotus.process_transfers() == 0
+
+
+def test_rejected_deposit_fails_without_retrying(app, mock_pnw):
+    mock, _ = mock_pnw
+    mock.config['MUTATION_FAULT'] = 'rejected'
+    queue_transfers(1)
+
+    lotus.process_transfers()
+
+    transfer = BankTransfer.query.one()
+    assert transfer.status == 'failed'
+    assert 'enough resources' in transfer.last_error
+
+
+def test_ambiguous_failure_is_never_replayed(app, mock_pnw):
+    mock, _ = mock_pnw
+    mock.config['MUTATION_FAULT'] = 'server_error'
+    queue_transfers(1)
+
+    lotus.process_transfers()
+
+    transfer = BankTransfer.query.one()
+    assert transfer.status == 'failed'
+    assert lotus.CHECK_BANK in transfer.last_error
+    assert len(mock.config['DEPOSITS']) == 1
+
+
+def test_unreachable_upstream_is_retried(app):
+    # Nothing listens on port 9, so the connection is refused before the
+    # deposit is written.
+    app.config['PNW_API_URL'] = 'http://127.0.0.1:9/graphql'
+    lotus.user_kits.reset()
+    queue_transfers(1)
+
+    lotus.process_transfers()
+
+    transfer = BankTransfer.query.one()
+    assert transfer.status == 'pending'
+    assert transfer.attempts == 1
+    assert transfer.next_attempt_at > transfer.updated_at
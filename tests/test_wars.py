@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as lotus
+from models import db, War
+
+
+@pytest.fixture
+def universe():
+    return {'nations': 10, 'wars': 30}
+
+
+def war_synced_at(synced_at, turns_left):
+    war = War(id=1)
+    war.set_turns_left(turns_left, synced_at)
+    return war
+
+
+@pytest.mark.parametrize('synced_at, turns_left, ends_at', [
+    (datetime(2024, 5, 1, 13, 5), 3, datetime(2024, 5, 1, 18)),
+    (datetime(2024, 5, 1, 13, 59, 59), 1, datetime(2024, 5, 1, 14)),
+    (datetime(2024, 5, 1, 14, 0), 1, datetime(2024, 5, 1, 16)),
+    (datetime(2024, 5, 1, 23, 30), 2, datetime(2024, 5, 2, 2)),
+    (datetime(2024, 5, 1, 13, 5), 0, datetime(2024, 5, 1, 13, 5)),
+])
+def test_set_turns_left_ends_on_a_turn_boundary(synced_at, turns_left, ends_at):
+    assert war_synced_at(synced_at, turns_left).ends_at == ends_at
+
+
+@pytest.mark.parametrize('now, remaining', [
+    (datetime(2024, 5, 1, 13, 5), 3),
+    (datetime(2024, 5, 1, 13, 59, 59), 3),
+    (datetime(2024, 5, 1, 14, 0), 2),
+    (datetime(2024, 5, 1, 17, 59, 59), 1),
+    (datetime(2024, 5, 1, 18, 0), 0),
+    (datetime(2024, 5, 2), 0),
+])
+def test_turns_remaining_counts_down_at_each_turn_change(now, remaining):
+    war = war_synced_at(datetime(2024, 5, 1, 13, 5), 3)
+
+    assert war.turns_remaining(now) == remaining
+    assert war.is_active(now) is (remaining > 0)
+
+
+def test_ended_war_has_no_turns_left():
+    war = war_synced_at(datetime(2024, 5, 1, 13, 5), 3)
+    war.end_date = datetime(2024, 5, 1, 13, 30)
+
+    assert war.turns_remaining(datetime(2024, 5, 1, 14)) == 0
+
+
+def test_sync_wars_only_refreshes_stale_or_expired_wars(app):
+    first = lotus.sync_wars()
+    assert first['new'] > 0
+    assert lotus.sync_wars()['refreshed'] == 0
+
+    running = War.query.filter(War.end_date.is_(None), War.ends_at > datetime.utcnow()).order_by(War.id).all()
+    stale, expired = running[0], running[1]
+    stale.synced_at -= timedelta(seconds=app.config['WAR_REFRESH_AGE'] + 1)
+    expired.ends_at = datetime.utcnow() - timedelta(minutes=1)
+    expired.synced_at = expired.ends_at - War.TURN_LENGTH
+    db.session.commit()
+
+    assert lotus.sync_wars()['refreshed'] == 2
+    assert lotus.sync_wars()['refreshed'] == 0
+
+
+def test_wars_widget_has_one_shape_before_and_after_sync(app):
+    upstream = lotus.get_alliance_wars(1)
+    lotus.sync_wars()
+    synced = lotus.get_alliance_wars(1)
+
+    assert upstream and synced
+    by_id = {war['id']: war for war in upstream}
+    for war in synced:
+        assert war.keys() == by_id[war['id']].keys()
+        assert {**war, 'turns_left': None} == {**by_id[war['id']], 'turns_left': None}
+        assert abs(war['turns_left'] - by_id[war['id']]['turns_left']) <= 1
@@ -0,0 +1,62 @@
+import argparse
+import logging
+import time
+
+from instrumentation import source
+from app import create_app, sync_roster, collect_prices, process_transfers, prune_activity_logs, prune_slow_requests, sync_wars, sync_ranks
+from models import db
+
+app = create_app()
+
+JOBS = {
+    'roster': (sync_roster, 'ROSTER_SYNC_INTERVAL'),
+    'prices': (collect_prices, 'PRICE_COLLECT_INTERVAL'),
+    'wars': (sync_wars, 'WAR_SYNC_INTERVAL'),
+    'ranks': (sync_ranks, 'RANK_SYNC_INTERVAL'),
+    'transfers': (process_transfers, 'TRANSFER_POLL_INTERVAL'),
+    'activity': (prune_activity_logs, 'ACTIVITY_LOG_PRUNE_INTERVAL'),
+    'slow_requests': (prune_slow_requests, 'SLOW_REQUEST_PRUNE_INTERVAL'),
+}
+
+def run_job(name):
+    func, _ = JOBS[name]
+    started = time.monotonic()
+    try:
+        with source(f'job:{name}'):
+            result = func()
+        app.logger.info(f"Job {name} finished in {time.monotonic() - started:.2f}s: {result}")
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Job {name} failed: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Lotus background sync worker')
+    parser.add_argument('jobs', nargs='*', help=f"jobs to run, any of {', '.join(sorted(JOBS))} (default: all)")
+    parser.add_argument('--once', action='store_true', help='run each job once and exit')
+    args = parser.parse_args()
+    
+    unknown = set(args.jobs) - set(JOBS)
+    if unknown:
+        parser.error(f"unknown job(s): {', '.join(sorted(unknown))}")
+    
+    jobs = args.jobs or sorted(JOBS)
+    app.logger.setLevel(logging.INFO)
+    next_run = {name: 0 for name in jobs}
+    
+    with app.app_context():
+        db.create_all()
+        
+        while True:
+            now = time.monotonic()
+            for name in jobs:
+                if now >= next_run[name]:
+                    run_job(name)
+                    next_run[name] = time.monotonic() + app.config[JOBS[name][1]]
+            
+            if args.once:
+                break
+            
+            time.sleep(max(1, min(next_run.values()) - time.monotonic()))
+
+if __name__ == '__main__':
+    main()